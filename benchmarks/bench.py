@@ -0,0 +1,312 @@
+"""Benchmarks of BTree's insert, search, update, delete and scan workloads.
+
+Each workload runs on a new tree for each order and size, and reports
+operations per second, latency percentiles, file's size and I/O per
+operation. Results can be saved as JSON and compared against a saved
+baseline.
+
+Usage:
+    python benchmarks/bench.py --orders 2 30 60 --sizes 10000 100000 --json new.json
+    python benchmarks/bench.py --baseline old.json --threshold 10
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+from time import perf_counter_ns
+from itertools import accumulate
+
+# Run from a checkout, with no install
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pybtree import BTree
+
+
+WORKLOADS = ('insert_seq', 'insert_random', 'search_uniform', 'search_zipf',
+             'search_miss', 'update', 'delete_churn', 'mixed', 'scan')
+
+
+class Workload():
+    """Represent a benchmark's run on a new tree.
+
+    Properties:
+        tree -- the BTree
+        keys -- keys in tree
+        rand -- random numbers' generator
+    """
+
+    def __init__(self, filepath, order, size, seed, **kwargs):
+        """Create an empty tree.
+
+        Keyword arguments:
+            filepath -- tree's file, removed if it exists
+            order -- BTree order
+            size -- number of keys the tree is filled with
+            seed -- random seed
+            kwargs -- BTree's keyword arguments
+        """
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+        self.filepath = filepath
+        self.size = size
+        self.rand = random.Random(seed)
+        self.tree = BTree(filepath, order, **kwargs)
+        self.keys = []
+
+    def fill(self):
+        """Fill the tree with size keys, in a single bulk load."""
+        self.keys = list(range(0, self.size * 2, 2))
+        self.tree.bulk_load((key, key) for key in self.keys)
+        self.tree.flush()
+
+    def run(self, name, ops, read_ratio):
+        """Return the operations of a workload, as functions.
+
+        Keyword arguments:
+            name -- workload's name
+            ops -- number of operations (inserts are as many as the tree's size)
+            read_ratio -- fraction of searches in the mixed workload
+        """
+        rand = self.rand
+        tree = self.tree
+
+        if name == 'insert_seq':
+            return [lambda k=k: tree.insert(k, k) for k in range(self.size)]
+
+        if name == 'insert_random':
+            keys = list(range(self.size))
+            rand.shuffle(keys)
+            return [lambda k=k: tree.insert(k, k) for k in keys]
+
+        self.fill()
+
+        if name == 'search_uniform':
+            return [lambda k=k: tree.search(k) for k in rand.choices(self.keys, k=ops)]
+
+        if name == 'search_zipf':
+            return [lambda k=k: tree.search(k) for k in self.zipf(ops)]
+
+        if name == 'search_miss':
+            # Keys between the ones in tree, as in dedup checks
+            return [lambda k=k: tree.search(k) for k in rand.choices(range(1, self.size * 2, 2), k=ops)]
+
+        if name == 'update':
+            # Counters' updates, popular keys are updated most
+            return [lambda k=k: tree.update(k, k + 1) for k in self.zipf(ops)]
+
+        if name == 'delete_churn':
+            # Delete a key, then insert a new one, so the tree keeps its size
+            ops = ops // 2
+            new = rand.sample(range(1, self.size * 2, 2), min(ops, self.size))
+            old = rand.sample(self.keys, len(new))
+
+            work = []
+
+            for a, b in zip(old, new):
+                work.append(lambda k=a: tree.delete(k))
+                work.append(lambda k=b: tree.insert(k, k))
+
+            return work
+
+        if name == 'mixed':
+            work = []
+
+            for _ in range(ops):
+                if rand.random() < read_ratio:
+                    key = rand.choice(self.keys)
+                    work.append(lambda k=key: tree.search(k))
+                else:
+                    key = rand.randrange(1, self.size * 2, 2)
+                    work.append(lambda k=key: tree.insert(k, k))
+
+            return work
+
+        if name == 'scan':
+            # Windows of 100 keys, read in order
+            starts = rand.choices(self.keys, k=max(1, ops // 10))
+            return [lambda k=k: sum(1 for _ in tree.range(k, k + 200)) for k in starts]
+
+        raise ValueError('Unknown workload {}. Options are {}.'.format(repr(name), list(WORKLOADS)))
+
+    def zipf(self, n, s=1.1):
+        """Return n keys, the ith most popular key taken with probability
+        proportional to 1 / i ** s. Popular keys are spread over the tree.
+
+        Keyword arguments:
+            n -- number of keys
+            s -- distribution's skew (default 1.1)
+        """
+        ranked = list(self.keys)
+        self.rand.shuffle(ranked)
+
+        weights = list(accumulate(1 / (i + 1) ** s for i in range(len(ranked))))
+        return self.rand.choices(ranked, cum_weights=weights, k=n)
+
+    def close(self):
+        """Close and remove the tree."""
+        self.tree.close()
+        os.remove(self.filepath)
+
+        if os.path.exists(self.filepath + '-bloom'):
+            os.remove(self.filepath + '-bloom')
+
+
+def percentile(values, p):
+    """Return the pth percentile of sorted values.
+
+    Keyword arguments:
+        values -- sorted numbers
+        p -- percentile, in [0, 100]
+    """
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def measure(workload, name, ops, read_ratio):
+    """Run a workload and return its results.
+
+    Keyword arguments:
+        workload -- a Workload
+        name -- workload's name
+        ops -- number of operations
+        read_ratio -- fraction of searches in the mixed workload
+    """
+    work = workload.run(name, ops, read_ratio)
+    storage = workload.tree.storage
+
+    reads, written = storage.bytes_read, storage.bytes_written
+    n_reads, n_writes = storage.n_reads, storage.n_writes
+    latencies = []
+
+    start = perf_counter_ns()
+
+    for op in work:
+        t = perf_counter_ns()
+        op()
+        latencies.append(perf_counter_ns() - t)
+
+    workload.tree.flush()
+    elapsed = perf_counter_ns() - start
+
+    latencies.sort()
+    n = len(work)
+
+    return {
+        'ops': n,
+        'ops_per_sec': n / (elapsed / 1e9),
+        'p50_us': percentile(latencies, 50) / 1e3,
+        'p90_us': percentile(latencies, 90) / 1e3,
+        'p99_us': percentile(latencies, 99) / 1e3,
+        'max_us': latencies[-1] / 1e3,
+        'file_size': storage.size,
+        'reads_per_op': (storage.n_reads - n_reads) / n,
+        'writes_per_op': (storage.n_writes - n_writes) / n,
+        'bytes_read_per_op': (storage.bytes_read - reads) / n,
+        'bytes_written_per_op': (storage.bytes_written - written) / n
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print each result's ops/sec change against the baseline's. Return
+    the number of regressions.
+
+    Keyword arguments:
+        results -- this run's results
+        baseline -- a previous run's results
+        threshold -- ops/sec's drop in percent that is a regression
+    """
+    def key(r):
+        return r['workload'], r['order'], r['size']
+
+    old = {key(r): r for r in baseline}
+    regressions = 0
+
+    print('\n{:<16} {:>6} {:>9} {:>12} {:>12} {:>8}'.format('workload', 'order', 'size',
+                                                             'base ops/s', 'ops/s', 'change'))
+
+    for r in results:
+        b = old.get(key(r))
+
+        if b is None:
+            continue
+
+        change = (r['ops_per_sec'] - b['ops_per_sec']) / b['ops_per_sec'] * 100
+        flag = ''
+
+        if change < -threshold:
+            flag = ' REGRESSION'
+            regressions += 1
+
+        print('{:<16} {:>6} {:>9} {:>12.0f} {:>12.0f} {:>7.1f}%{}'.format(r['workload'], r['order'], r['size'],
+                                                                         b['ops_per_sec'], r['ops_per_sec'],
+                                                                         change, flag))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark BTree workloads.')
+    parser.add_argument('--orders', type=int, nargs='+', default=[2, 30, 60], help='BTree orders')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='numbers of keys in tree')
+    parser.add_argument('--workloads', nargs='+', default=list(WORKLOADS), choices=WORKLOADS)
+    parser.add_argument('--ops', type=int, default=10000, help='operations per workload, but inserts (default 10000)')
+    parser.add_argument('--read-ratio', type=float, default=0.9, help='searches in the mixed workload (default 0.9)')
+    parser.add_argument('--storage', default='file', help="'file' or 'mmap' (default 'file')")
+    parser.add_argument('--cache-nodes', type=int, default=0, help='nodes kept in memory (default 0)')
+    parser.add_argument('--bloom', action='store_true', help="keep a Bloom filter sized for the tree's keys")
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default 0)')
+    parser.add_argument('--dir', default=None, help="directory of the trees' files (default a temporary one)")
+    parser.add_argument('--json', help='save results as JSON in this file')
+    parser.add_argument('--baseline', help='compare against the results saved in this JSON file')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='ops/sec drop in percent that fails the comparison (default 10)')
+    args = parser.parse_args(argv)
+
+    directory = args.dir or tempfile.mkdtemp(prefix='pybtree-bench-')
+    filepath = os.path.join(directory, 'bench.btree')
+    results = []
+
+    print('{:<16} {:>6} {:>9} {:>12} {:>9} {:>9} {:>9} {:>11} {:>10} {:>10}'.format(
+        'workload', 'order', 'size', 'ops/s', 'p50 us', 'p99 us', 'max us', 'file', 'read B/op', 'write B/op'))
+
+    for name in args.workloads:
+        for order in args.orders:
+            for size in args.sizes:
+                workload = Workload(filepath, order, size, args.seed, storage=args.storage,
+                                    cache_nodes=args.cache_nodes, bloom=size if args.bloom else 0)
+
+                try:
+                    result = measure(workload, name, args.ops, args.read_ratio)
+                finally:
+                    workload.close()
+
+                result.update(workload=name, order=order, size=size)
+                results.append(result)
+
+                print('{:<16} {:>6} {:>9} {:>12.0f} {:>9.1f} {:>9.1f} {:>9.1f} {:>11} {:>10.0f} {:>10.0f}'.format(
+                    name, order, size, result['ops_per_sec'], result['p50_us'], result['p99_us'],
+                    result['max_us'], result['file_size'], result['bytes_read_per_op'],
+                    result['bytes_written_per_op']))
+
+    # Temporary directory is empty by now
+    if args.dir is None:
+        os.rmdir(directory)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+        if compare(results, baseline, args.threshold) > 0:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,3 @@
 from .btree import BTree
+from .bplustree import BPlusTree
+from .aio import AsyncBTree
@@ -0,0 +1,242 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from .btree import BTree
+
+
+class AsyncBTree():
+    """Represent a BTree used from an asyncio event loop.
+
+    Disk work runs in threads, so the loop never blocks on it. Lookups run
+    on a bounded pool of readers and the lookups made while the loop is busy
+    are merged into a single search_many, so they share every node on the
+    way down. Writes run one at a time, in the order they are called, on a
+    single writer thread. A lookup sees every write awaited before it.
+
+    Properties:
+        tree -- the BTree (concurrent, so readers and the writer share it)
+    """
+
+    def __init__(self, filepath, order=60, workers=4, **kwargs):
+        """Construct a tree. Opening it blocks, like BTree does.
+
+        Keyword arguments:
+            filepath -- path to save BTree
+            order -- BTree order (default 60)
+            workers -- number of threads running lookups (default 4)
+            kwargs -- same as BTree's (concurrent is always True)
+        """
+        kwargs['concurrent'] = True
+        self.__filepath = filepath
+        self.tree = BTree(filepath, order, **kwargs)
+
+        self.__readers = ThreadPoolExecutor(workers, thread_name_prefix='pybtree-read')
+        self.__writer = ThreadPoolExecutor(1, thread_name_prefix='pybtree-write')
+        self.__lookups = {}      # futures of the lookups not dispatched yet, by key
+
+    async def search(self, key):
+        """Search for a key and return its value. None, if it does not exist.
+
+        Keyword arguments:
+            key -- key to be searched
+        """
+        future = self.__lookups.get(key)
+
+        # Same key, same lookup
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+
+            # Lookups made until the loop runs again go together
+            if not self.__lookups:
+                loop.call_soon(self.__dispatch, loop)
+
+            self.__lookups[key] = future
+
+        # A cancelled caller does not cancel the others' lookup
+        return await asyncio.shield(future)
+
+    async def search_many(self, keys):
+        """Search many keys at once.
+
+        Return a list of values (None for missing keys) in keys' order.
+
+        Keyword arguments:
+            keys -- an iterable of keys to be searched
+        """
+        return await self.__read(self.tree.search_many, list(keys))
+
+    async def range(self, lo=None, hi=None, chunk=256):
+        """Iterate over (key, value) pairs with lo <= key < hi, in key order,
+        in an async for.
+
+        Pairs are read chunk by chunk, each one in a single read of the
+        tree. Writes may run between chunks.
+
+        Keyword arguments:
+            lo -- smallest key (default None, no bound)
+            hi -- key after the greatest one (default None, no bound)
+            chunk -- number of pairs read at once (default 256)
+        """
+        skip = 0    # pairs with lo as key already yielded
+
+        while True:
+            items = await self.__read(self.__chunk, lo, hi, skip, chunk)
+
+            for item in items:
+                yield item
+
+            # Tree is over
+            if len(items) < chunk:
+                return
+
+            # Next chunk starts at the last key, without the pairs already yielded
+            last = items[-1][0]
+            skip = sum(1 for key, _ in items if key == last) + (skip if last == lo else 0)
+            lo = last
+
+    async def insert(self, key, value):
+        """Insert key,value in the BTree.
+
+        Keyword arguments:
+            key -- key to be inserted
+            value -- key's value
+        """
+        await self.__write(self.tree.insert, key, value)
+
+    async def insert_many(self, items):
+        """Insert many key,value pairs at once.
+
+        Keyword arguments:
+            items -- an iterable of (key, value) pairs
+        """
+        await self.__write(self.tree.insert_many, list(items))
+
+    async def update(self, key, value):
+        """Replace an existing key's value.
+
+        Return True, if key was found. False, otherwise.
+
+        Keyword arguments:
+            key -- key to be updated
+            value -- key's new value
+        """
+        return await self.__write(self.tree.update, key, value)
+
+    async def upsert(self, key, value):
+        """Replace key's value, if key exists. Insert key,value, otherwise.
+
+        Return True, if key existed. False, if it was inserted.
+
+        Keyword arguments:
+            key -- key to be updated or inserted
+            value -- key's value
+        """
+        return await self.__write(self.tree.upsert, key, value)
+
+    async def get_or_insert(self, key, value):
+        """Return key's value, if key exists. Insert key,value and return
+        value, otherwise.
+
+        Keyword arguments:
+            key -- key to be searched
+            value -- value inserted, if key does not exist
+        """
+        return await self.__write(self.tree.get_or_insert, key, value)
+
+    async def delete(self, key):
+        """Delete a key from the BTree.
+
+        Keyword arguments:
+            key -- key to be deleted
+        """
+        await self.__write(self.tree.delete, key)
+
+    async def delete_many(self, keys):
+        """Delete many keys at once.
+
+        Keyword arguments:
+            keys -- an iterable of keys to be deleted
+        """
+        await self.__write(self.tree.delete_many, list(keys))
+
+    async def flush(self):
+        """Write all pending changes to disk, after the writes called before."""
+        await self.__write(self.tree.flush)
+
+    async def close(self):
+        """Wait for the writes called before, close the tree and stop the
+        threads."""
+        await self.__write(self.tree.close)
+
+        self.__readers.shutdown()
+        self.__writer.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __dispatch(self, loop):
+        """Search all waiting lookups' keys at once, on a reader thread.
+
+        Keyword arguments:
+            loop -- the running event loop
+        """
+        lookups, self.__lookups = self.__lookups, {}
+        keys = list(lookups)
+
+        def done(job):
+            # Every lookup gets the batch's error
+            if job.exception() is not None:
+                for future in lookups.values():
+                    if not future.done():
+                        future.set_exception(job.exception())
+                return
+
+            for key, value in zip(keys, job.result()):
+                future = lookups[key]
+
+                if not future.done():
+                    future.set_result(value)
+
+        loop.run_in_executor(self.__readers, self.tree.search_many, keys).add_done_callback(done)
+
+    def __chunk(self, lo, hi, skip, n):
+        """Return the first n pairs with lo <= key < hi, after skipping the
+        first skip ones. Runs on a reader thread.
+
+        Keyword arguments:
+            lo -- smallest key
+            hi -- key after the greatest one
+            skip -- number of pairs to be skipped
+            n -- number of pairs
+        """
+        items = []
+
+        # Iterator holds the lock until it is closed, so the chunk has no write in between
+        with closing(self.tree.range(lo, hi)) as pairs:
+            for i, item in enumerate(pairs):
+                if i < skip:
+                    continue
+
+                items.append(item)
+
+                if len(items) == n:
+                    break
+
+        return items
+
+    async def __read(self, function, *args):
+        """Run a read on a reader thread and return its result."""
+        return await asyncio.get_running_loop().run_in_executor(self.__readers, function, *args)
+
+    async def __write(self, function, *args):
+        """Run a write on the writer thread, after the writes called before,
+        and return its result."""
+        return await asyncio.get_running_loop().run_in_executor(self.__writer, function, *args)
+
+    def __repr__(self):
+        """Class representation string."""
+        return "{}({})".format(self.__class__.__name__, self.__filepath)
@@ -0,0 +1,193 @@
+import os
+import zlib
+from math import ceil, exp, log
+from hashlib import blake2b
+from struct import Struct, error
+from .layout import SlottedLayout
+
+
+def encoder(key_format):
+    """Return a function that encodes a key of key_format as bytes. Keys
+    that are equal in a tree (e.g. 1 and 1.0 in 'i') get the same bytes.
+
+    Keyword arguments:
+        key_format -- keys' format: a struct format, 'bytes' or 'str'
+    """
+    _, encode, _ = SlottedLayout.codec(key_format)
+
+    # -0.0 == 0.0, but their bytes differ
+    if key_format in ('f', 'd'):
+        return lambda key: encode(key + 0.0)
+
+    # 1.0 == 1, but 1.0 cannot be packed as an int
+    if key_format in tuple('bBhHiIlLqQ'):
+        return lambda key: encode(int(key))
+
+    return encode
+
+
+class BloomFilter():
+    """Represent a Bloom filter of a tree's keys, kept in memory and saved
+    in a sidecar file.
+
+    Each key sets n_hashes bits of a bit array. A key that was added always
+    finds its bits set, other keys find them all set only with a small
+    probability (a false positive). Keys cannot be removed, so deleted keys
+    stay in the filter until it is rebuilt.
+
+    File layout: magic, number of hashes, number of bits, capacity, number
+    of keys, tree file's size and modification time when saved, bits' crc32
+    and bits. A file whose tree was changed since is not loaded.
+
+    Properties:
+        capacity -- number of keys the filter is sized for
+        n_keys -- number of keys added
+        n_bits -- size of bit array
+        n_hashes -- number of bits set by a key
+        error -- expected false positive's probability with n_keys keys
+    """
+    head = Struct('<iIQQQqqI')
+    magic = 0x626c6f6d      # 'blom'
+
+    def __init__(self, filepath, encode, capacity, error=0.01):
+        """Create an empty filter.
+
+        Keyword arguments:
+            filepath -- absolute/relative path of the sidecar file
+            encode -- function that encodes a key as bytes
+            capacity -- number of keys the filter is sized for
+            error -- false positive's probability with capacity keys (default 0.01)
+        """
+        if not 0 < error < 1:
+            raise ValueError('Bloom filter\'s error should be in (0, 1).')
+
+        self.__filepath = filepath
+        self.__encode = encode
+        self.__error = error
+
+        self.clear(capacity)
+
+    @property
+    def error(self):
+        return (1 - exp(-self.n_hashes * self.n_keys / self.n_bits)) ** self.n_hashes
+
+    def clear(self, capacity):
+        """Remove all keys and resize the filter.
+
+        Keyword arguments:
+            capacity -- number of keys the filter is sized for
+        """
+        capacity = max(1, capacity)
+
+        # Bits and hashes that give the least error for capacity keys
+        n_bits = ceil(-capacity * log(self.__error) / log(2) ** 2)
+        n_bits = max(64, -(-n_bits // 8) * 8)
+
+        self.capacity = capacity
+        self.n_keys = 0
+        self.n_bits = n_bits
+        self.n_hashes = max(1, round(n_bits / capacity * log(2)))
+        self.__bits = bytearray(n_bits // 8)
+
+    def add(self, key):
+        """Add a key.
+
+        Keyword arguments:
+            key -- a key
+        """
+        h1, h2 = self.__hashes(key)
+        bits = self.__bits
+        n = self.n_bits
+
+        for j in range(self.n_hashes):
+            i = (h1 + j * h2) % n
+            bits[i >> 3] |= 1 << (i & 7)
+
+        self.n_keys += 1
+
+    def __contains__(self, key):
+        """Return False, if key was never added. True, if it may have been."""
+        try:
+            h1, h2 = self.__hashes(key)
+        except (error, TypeError, ValueError, OverflowError, AttributeError):
+            # Key does not fit in keys' format, so it is not in tree
+            return False
+
+        bits = self.__bits
+        n = self.n_bits
+
+        # Most missing keys stop at the first bits
+        for j in range(self.n_hashes):
+            i = (h1 + j * h2) % n
+
+            if not bits[i >> 3] & 1 << (i & 7):
+                return False
+
+        return True
+
+    def load(self, size, mtime):
+        """Read the filter from file, if it was saved with the tree as it is
+        now. Either way, the file is marked as outdated, so a crash before
+        the next save leaves no outdated filter to be loaded.
+
+        Return True, if the filter was loaded.
+
+        Keyword arguments:
+            size -- tree file's size in bytes
+            mtime -- tree file's modification time in nanoseconds
+        """
+        if not os.path.exists(self.__filepath):
+            return False
+
+        with open(self.__filepath, 'r+b') as f:
+            data = f.read()
+
+            # Until it is saved again, tree may change with no filter
+            f.seek(0)
+            f.write(self.head.pack(self.magic, 0, 0, 0, 0, -1, -1, 0))
+
+        if len(data) < self.head.size:
+            return False
+
+        magic, n_hashes, n_bits, capacity, n_keys, saved_size, saved_mtime, crc = self.head.unpack_from(data)
+        bits = data[self.head.size:]
+
+        if (magic != self.magic or (saved_size, saved_mtime) != (size, mtime) or
+                len(bits) * 8 != n_bits or zlib.crc32(bits) != crc):
+            return False
+
+        self.capacity = capacity
+        self.n_keys = n_keys
+        self.n_bits = n_bits
+        self.n_hashes = n_hashes
+        self.__bits = bytearray(bits)
+
+        return True
+
+    def save(self, size, mtime):
+        """Write the filter in file, with the tree file's state it matches.
+
+        Keyword arguments:
+            size -- tree file's size in bytes
+            mtime -- tree file's modification time in nanoseconds
+        """
+        head = self.head.pack(self.magic, self.n_hashes, self.n_bits, self.capacity, self.n_keys,
+                              size, mtime, zlib.crc32(self.__bits))
+
+        with open(self.__filepath, 'wb') as f:
+            f.write(head + self.__bits)
+
+    def __hashes(self, key):
+        """Return a key's two hashes. Its jth bit is (h1 + j * h2) % n_bits.
+
+        Keyword arguments:
+            key -- a key
+        """
+        h = int.from_bytes(blake2b(self.__encode(key), digest_size=16).digest(), 'little')
+
+        return h & 0xffffffffffffffff, h >> 64 | 1
+
+    def __repr__(self):
+        """Class representation string."""
+        return "{}({}, n_keys={}, n_bits={})".format(self.__class__.__name__, self.__filepath,
+                                                   self.n_keys, self.n_bits)
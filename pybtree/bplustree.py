@@ -0,0 +1,847 @@
+from bisect import bisect_left, bisect_right
+from .header import (MAGIC, VERSION, HEADER_LEN, H_ORDER, H_ROOT, H_N_FREE, H_KEY_CODE, H_VALUE_CODE,
+                     H_KIND, BPLUSTREE, new_header, header_format, read_header, write_header, trim,
+                     allocate, free, set_root)
+from .layout import PlusNode, PlusLayout
+from .storage import STORAGES
+from .cache import NodeCache
+
+
+class BPlusTree():
+    """Represent a on-disk B+ tree implementation.
+
+    Values are only kept in leaves, so inner nodes hold separator keys and
+    children only and have a higher fan-out. Each leaf knows its previous
+    and next leaves, so an ordered scan reads leaves one after another,
+    never going back up the tree.
+
+    Properties:
+        root -- a PlusNode as root tree
+        order -- B+ tree order, the minimum number of keys in a leaf (default 60)
+        n_free -- number of free node slots in file
+    """
+
+    def __init__(self, filepath, order=60, **kwargs):
+        """Construct a tree.
+
+        Keyword argument:
+            filepath -- path to save B+ tree
+            order -- B+ tree order (default 60)
+            storage -- {'mmap', (default 'file')} how nodes are read/written
+            cache_nodes -- number of nodes kept in memory (default 0)
+            key_format -- keys' struct format: an int, float or '<size>s' for bytes (default 'i')
+            value_format -- values' struct format, same options as keys (default 'i')
+        """
+        # Get storage backend
+        storage = kwargs.get('storage', 'file')
+
+        if storage not in STORAGES:
+            raise ValueError('Unknown storage {}. Options are {}.'.format(repr(storage),
+                                                                         sorted(STORAGES)))
+
+        # Open file with tree
+        self.__filepath = filepath
+        self.__file = STORAGES[storage](filepath, 'i')
+
+        # Keep the most recently used nodes in memory
+        cache_nodes = kwargs.get('cache_nodes', 0)
+        self.__cache = NodeCache(cache_nodes, self.__write) if cache_nodes > 0 else None
+
+        # Load root
+        self.__bootstrap(order, kwargs.get('key_format', 'i'), kwargs.get('value_format', 'i'))
+
+    @property
+    def order(self):
+        return self.__order
+
+    @property
+    def n_free(self):
+        return self.__header[H_N_FREE]
+
+    @property
+    def key_format(self):
+        return self.__layout.key_format
+
+    @property
+    def value_format(self):
+        return self.__layout.value_format
+
+    @property
+    def cache(self):
+        """Return the node cache (with hit/miss counters). None, if disabled."""
+        return self.__cache
+
+    @property
+    def max_keys(self):
+        return self.__order * 2
+
+    @property
+    def min_keys(self):
+        return self.__order
+
+    @property
+    def max_inner(self):
+        return self.__layout.max_inner
+
+    @property
+    def min_inner(self):
+        return self.__layout.max_inner // 2
+
+    @property
+    def node_len(self):
+        return self.__layout.node_len
+
+    def insert(self, key, value):
+        """Insert key,value in the B+ tree. If key exists, its value is replaced.
+
+        Keyword arguments:
+            key -- key to be inserted
+            value -- key's value
+        """
+        key = self.__key(key)
+        self.__layout.check(key, value)
+
+        path, leaf = self.__find_leaf(key)
+        i = leaf.find(key)
+
+        # Key exists, just replace its value
+        if i is not None:
+            leaf.values[i] = value
+            self.__save(leaf)
+            return
+
+        leaf.append_key(key, value)
+
+        # If leaf is full, we need to break into parts
+        if leaf.n_keys > self.max_keys:
+            self.__split_leaf(path, leaf)
+        else:
+            self.__save(leaf)
+
+    def bulk_load(self, items, fill_factor=1.0):
+        """Fill an empty B+ tree from (key, value) pairs sorted by key.
+
+        Leaves are written one after another in one pass, so a scan of the
+        loaded tree reads the file sequentially. Inner nodes are written
+        after them, level by level.
+
+        Keyword arguments:
+            items -- an iterable of (key, value) in strictly increasing key order
+            fill_factor -- fraction of max_keys/max_inner put in each node (default 1.0)
+        """
+        if self.root.n_keys > 0:
+            raise ValueError('Only an empty B+ tree can be bulk loaded.')
+
+        if not 0 < fill_factor <= 1:
+            raise ValueError('Fill factor should be in (0, 1].')
+
+        # Number of keys per node, never less than the minimum
+        fill = max(self.min_keys, min(self.max_keys, int(round(fill_factor * self.max_keys))))
+        fill_inner = max(self.min_inner, min(self.max_inner, int(round(fill_factor * self.max_inner))))
+
+        # Leaves' first keys and positions, the level above the leaves
+        level = []
+
+        # Two leaves are kept in memory, so the last two can still be balanced
+        prev = None
+        leaf = []
+        last = None
+
+        for key, value in items:
+            key = self.__key(key)
+
+            if last is not None and key <= last:
+                raise ValueError('Keys should be in strictly increasing order.')
+
+            self.__layout.check(key, value)
+            last = key
+
+            if len(leaf) == fill:
+                if prev is not None:
+                    self.__bulk_leaf(level, prev, False)
+
+                prev, leaf = leaf, []
+
+            leaf.append((key, value))
+
+        if last is None:
+            return
+
+        # Balance an underflowing last leaf with its left brother
+        if prev is not None and len(leaf) < self.min_keys:
+            leaf = prev + leaf
+            prev = None
+
+            if len(leaf) > self.max_keys:
+                i = len(leaf) // 2
+                prev, leaf = leaf[:i], leaf[i:]
+
+        if prev is not None:
+            self.__bulk_leaf(level, prev, False)
+
+        self.__bulk_leaf(level, leaf, True)
+
+        # Build inner nodes until a single node is left
+        while len(level) > 1:
+            level = self.__bulk_level(level, fill_inner)
+
+        # Old root is empty, the top node replaces it
+        old = self.root
+        self.__set_root(self.__get_node(level[0][1]))
+        self.__free(old.pos)
+
+    def search(self, key):
+        """Search a key in the B+ tree.
+
+        Return value, if key was found. None, otherwise.
+
+        Keyword arguments:
+            key -- key to be searched
+        """
+        key = self.__key(key)
+        _, leaf = self.__find_leaf(key)
+        i = leaf.find(key)
+
+        return None if i is None else leaf.values[i]
+
+    def delete(self, key):
+        """Delete a key from the B+ tree.
+
+        Keyword arguments:
+            key -- key to be deleted
+        """
+        key = self.__key(key)
+        path, leaf = self.__find_leaf(key)
+        i = leaf.find(key)
+
+        # Key was not found
+        if i is None:
+            return
+
+        leaf.remove_key(i)
+        self.__save(leaf)
+
+        # If leaf has less keys then the minimum (underflow)...
+        if path and leaf.n_keys < self.min_keys:
+            self.__rebalance_leaf(path, leaf)
+
+    def range(self, lo=None, hi=None, reverse=False):
+        """Iterate over (key, value) pairs with lo <= key < hi, in key order.
+
+        The first leaf is found from the root, then leaves are read one after
+        another through their links. The B+ tree should not be changed while
+        iterating.
+
+        Keyword arguments:
+            lo -- smallest key (default None, no bound)
+            hi -- key after the greatest one (default None, no bound)
+            reverse -- if True, iterate in descending order (default False)
+        """
+        lo = None if lo is None else self.__key(lo)
+        hi = None if hi is None else self.__key(hi)
+
+        if lo is not None and hi is not None and lo >= hi:
+            return
+
+        if reverse:
+            leaf = self.__edge_leaf(-1) if hi is None else self.__find_leaf(hi)[1]
+            i = leaf.n_keys if hi is None else bisect_left(leaf.keys, hi)
+
+            while True:
+                # Keys before i are less than hi
+                for i in range(i - 1, -1, -1):
+                    if lo is not None and leaf.keys[i] < lo:
+                        return
+
+                    yield leaf.item(i)
+
+                if leaf.prev == 0:
+                    return
+
+                leaf = self.__get_node(leaf.prev)
+                i = leaf.n_keys
+        else:
+            leaf = self.__edge_leaf(0) if lo is None else self.__find_leaf(lo)[1]
+            i = 0 if lo is None else bisect_left(leaf.keys, lo)
+
+            while True:
+                # Keys from i on are greater than or equal to lo
+                for i in range(i, leaf.n_keys):
+                    if hi is not None and leaf.keys[i] >= hi:
+                        return
+
+                    yield leaf.item(i)
+
+                if leaf.next == 0:
+                    return
+
+                leaf = self.__get_node(leaf.next)
+                i = 0
+
+    def items(self):
+        """Iterate over all (key, value) pairs in key order."""
+        return self.range()
+
+    def keys(self):
+        """Iterate over all keys in order."""
+        for key, _ in self.range():
+            yield key
+
+    def __iter__(self):
+        """Iterate over all keys in order."""
+        return self.keys()
+
+    def display(self, node=None, level=0):
+        """String representation of a B+ tree."""
+        if level == 0:
+            print("Order: {}".format(self.order))
+
+        # Nodes to print, children in order
+        stack = [(self.root if node is None else node, level)]
+
+        while stack:
+            node, level = stack.pop()
+            node = self.__get_node(node)
+
+            t = "\t" * level
+
+            if node.is_leaf:
+                print(t + "#{}, {} keys, leaf".format(node.pos, node.n_keys))
+                print(t + "\tItems: {}".format(str(node.items())))
+                print(t + "\tPrev: {}, Next: {}".format(node.prev, node.next))
+            else:
+                print(t + "#{}, {} keys, {} children".format(node.pos, node.n_keys, node.n_children))
+                print(t + "\tKeys: {}".format(str(list(node.keys))))
+                print(t + "\tChildren: {}".format(str(list(node.children))))
+
+            print('-' * 60)
+
+            stack.extend((child, level + 1) for child in reversed(node.children))
+
+    def check(self):
+        """Return True if all nodes in tree follow the rules of a B+ tree."""
+        leaves = []
+        self.__check(self.root, None, None, 0, leaves)
+
+        # Leaves are all at the same depth
+        if len(set(depth for depth, _ in leaves)) > 1:
+            raise ValueError('Leaves at different depths.')
+
+        # Leaves are linked in key order
+        leaves = [leaf for _, leaf in leaves]
+
+        if leaves[0].prev != 0 or leaves[-1].next != 0:
+            raise ValueError('First leaf with a previous or last leaf with a next leaf.')
+
+        for left, right in zip(leaves, leaves[1:]):
+            if left.next != right.pos or right.prev != left.pos:
+                raise ValueError('Leaves #{} and #{} are not linked.'.format(left.pos, right.pos))
+
+        return True
+
+    def flush(self):
+        """Write all pending changes to disk."""
+        if self.__cache is not None:
+            self.__cache.flush()
+
+        self.__file.flush()
+
+    def close(self):
+        """Write all pending changes to disk and close the file."""
+        self.flush()
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __bootstrap(self, order, key_format, value_format):
+        """Get root from file if exists. Create, otherwise."""
+        # Get tree's header
+        first = self.__file.read(0, 1)
+
+        if first is None:  # there is no data in file
+            self.__order = order
+            self.__layout = PlusLayout(key_format, value_format, self.max_keys)
+
+            # Header of a file with no free slot
+            self.__header = new_header(BPLUSTREE, order, self.key_format, self.value_format)
+            self.__write_header()
+
+            # Save an empty root, a leaf
+            self.root = self.__layout.node(HEADER_LEN)
+            self.__save(self.root)
+            return
+
+        self.__header = read_header(self.__file, self.__file.read)
+
+        if self.__header[0] != MAGIC or self.__header[H_KIND] != BPLUSTREE:
+            raise ValueError('File has no B+ tree.')
+
+        if self.__header[1] > VERSION:
+            raise ValueError('Unsupported file version {}.'.format(self.__header[1]))
+
+        # Set order and record layout
+        self.__order = self.__header[H_ORDER]
+        self.__layout = PlusLayout(self.__format(H_KEY_CODE), self.__format(H_VALUE_CODE), self.max_keys)
+
+        # Drop spare cells left by an unclean close
+        self.__trim()
+
+        # Get root
+        self.root = self.__load(self.__header[H_ROOT])
+
+    def __format(self, i):
+        """Return the format saved in the ith header's cell.
+
+        Keyword arguments:
+            i -- index of format's code
+        """
+        return header_format(self.__header, i)
+
+    def __write_header(self):
+        """Write header in file."""
+        write_header(self.__file, self.__header, self.__file.write)
+
+    def __set_root(self, node):
+        """Set node as root and save its position in header.
+
+        Keyword arguments:
+            node -- the new root
+        """
+        self.root = node
+        set_root(self.__file, self.__header, node.pos, self.__file.write)
+
+    def __trim(self):
+        """Truncate spare cells left after the last node by an unclean close."""
+        trim(self.__file, self.node_len, self.__file.read)
+
+    def __load(self, pos):
+        """Load a node's data from file and return a PlusNode object.
+
+        Keyword argument:
+            pos -- node's index in file
+        """
+        # Read the whole node at once
+        return self.__layout.unpack(self.__file.read(pos, self.node_len))
+
+    def __get_node(self, node):
+        """Get a node. If node is a number, load from file.
+
+        Keyword arguments:
+            node -- a node
+        """
+        if isinstance(node, PlusNode):
+            return node
+
+        if self.__cache is None:
+            return self.__load(node)
+
+        # Look for node in cache first
+        cached = self.__cache.get(node)
+
+        if cached is None:
+            cached = self.__load(node)
+            self.__cache.put(cached)
+
+        return cached
+
+    def __save(self, node):
+        """Save node. If cached, it is written back later.
+
+        Keyword arguments:
+            node -- a node to be saved
+        """
+        # New nodes go to disk, so the file grows
+        if self.__cache is None or node.pos >= self.__file.length:
+            self.__write(node)
+
+            if self.__cache is not None:
+                self.__cache.put(node)
+        else:
+            self.__cache.put(node, dirty=True)
+
+    def __write(self, node):
+        """Write node in file.
+
+        Keyword arguments:
+            node -- a node to be written
+        """
+        # Write node on-disk at once
+        self.__file.write(node.pos, self.__layout.pack(node))
+
+    def __allocate(self):
+        """Return a position for a new node.
+
+        A free slot is reused, if any. Otherwise, the node goes to the end of
+        file and should be saved before the next allocation.
+        """
+        return allocate(self.__file, self.__header, self.__file.read, self.__file.write)
+
+    def __free(self, pos):
+        """Put a node's slot in the free list.
+
+        Keyword argument:
+            pos -- slot's position
+        """
+        free(self.__file, self.__header, pos, self.__file.write)
+
+        # Forget node
+        if self.__cache is not None:
+            self.__cache.discard(pos)
+
+    def __key(self, key):
+        """Return key as it is saved, so it compares equal to the key read
+        back (e.g. a float of format 'f' in single precision).
+
+        Keyword arguments:
+            key -- a key
+        """
+        round_key = self.__layout.round_key
+        return key if round_key is None else round_key(key)
+
+    def __find_leaf(self, key):
+        """Search for the leaf that can have the key.
+
+        Return (path, leaf), where path is a list of (node, child's index)
+        from the root to leaf's father.
+
+        Keyword arguments:
+            key -- key to be searched
+        """
+        path = []
+        node = self.root
+
+        while not node.is_leaf:
+            # Separators are their right subtree's smallest keys
+            i = bisect_right(node.keys, key)
+
+            path.append((node, i))
+            node = self.__get_node(node.children[i])
+
+        return path, node
+
+    def __edge_leaf(self, i):
+        """Return the first (i = 0) or the last (i = -1) leaf.
+
+        Keyword arguments:
+            i -- child's index taken in every node
+        """
+        node = self.root
+
+        while not node.is_leaf:
+            node = self.__get_node(node.children[i])
+
+        return node
+
+    def __split_leaf(self, path, leaf):
+        """Split a leaf, linking the new leaf between it and its next one.
+
+        Keyword arguments:
+            path -- (node, child's index) from the root to leaf's father
+            leaf -- a leaf with too many keys
+        """
+        i = leaf.n_keys // 2
+
+        # New leaf gets keys after split index
+        node = self.__layout.node(self.__allocate(), leaf.keys[i:], leaf.values[i:], (), leaf.pos, leaf.next)
+
+        # Keep keys before split index in leaf,
+        # so no node has too many keys when it is written
+        del leaf.keys[i:]
+        del leaf.values[i:]
+        leaf.next = node.pos
+
+        # Save on-disk
+        self.__save(node)
+        self.__save(leaf)
+
+        # Next leaf goes back to the new one
+        if node.next != 0:
+            nxt = self.__get_node(node.next)
+            nxt.prev = node.pos
+            self.__save(nxt)
+
+        # New leaf's smallest key separates it from leaf
+        self.__insert_inner(path, node.keys[0], leaf, node.pos)
+
+    def __insert_inner(self, path, key, child, pos):
+        """Link a new node at child's right in their father, splitting it
+        if needed.
+
+        Keyword arguments:
+            path -- (node, child's index) from the root to child's father
+            key -- key that separates child from the new node
+            child -- a node just split
+            pos -- new node's position
+        """
+        # Child is the root, create a new father and set it as root
+        if not path:
+            root = self.__layout.node(self.__allocate(), [key], (), [child.pos, pos])
+            self.__save(root)
+            self.__set_root(root)
+            return
+
+        father, i = path.pop()
+
+        father.keys.insert(i, key)
+        father.children.insert(i + 1, pos)
+
+        if father.n_keys <= self.max_inner:
+            self.__save(father)
+            return
+
+        # Split father, its middle key goes up
+        i = father.n_keys // 2
+        k = father.keys[i]
+
+        node = self.__layout.node(self.__allocate(), father.keys[i + 1:], (), father.children[i + 1:])
+
+        del father.keys[i:]
+        del father.children[i + 1:]
+
+        # Save on-disk
+        self.__save(node)
+        self.__save(father)
+
+        self.__insert_inner(path, k, father, node.pos)
+
+    def __rebalance_leaf(self, path, leaf):
+        """Borrow a key from a brother or join leaf with one.
+
+        Keyword arguments:
+            path -- (node, child's index) from the root to leaf's father
+            leaf -- an underflowing leaf
+        """
+        father, i = path[-1]
+
+        # Borrow left brother's last key
+        if i > 0:
+            left = self.__get_node(father.children[i - 1])
+
+            if left.n_keys > self.min_keys:
+                leaf.keys.insert(0, left.keys.pop())
+                leaf.values.insert(0, left.values.pop())
+                father.keys[i - 1] = leaf.keys[0]
+
+                # Save on-disk
+                self.__save(left)
+                self.__save(leaf)
+                self.__save(father)
+                return
+
+        # Borrow right brother's first key
+        if i < father.n_keys:
+            right = self.__get_node(father.children[i + 1])
+
+            if right.n_keys > self.min_keys:
+                leaf.keys.append(right.keys.pop(0))
+                leaf.values.append(right.values.pop(0))
+                father.keys[i] = right.keys[0]
+
+                # Save on-disk
+                self.__save(right)
+                self.__save(leaf)
+                self.__save(father)
+                return
+
+        # No brother is able to lose a key, join the right one into the left one
+        if i > 0:
+            right = leaf
+            i -= 1
+        else:
+            left = leaf
+
+        left.keys.extend(right.keys)
+        left.values.extend(right.values)
+        left.next = right.next
+
+        # Next leaf goes back to the left one
+        if left.next != 0:
+            nxt = self.__get_node(left.next)
+            nxt.prev = left.pos
+            self.__save(nxt)
+
+        self.__save(left)
+        self.__free(right.pos)
+
+        # Father loses the key between them
+        del father.keys[i]
+        del father.children[i + 1]
+
+        self.__shrink(path)
+
+    def __shrink(self, path):
+        """Save an inner node that lost a key. If it underflows, borrow a
+        key from a brother or join it with one.
+
+        Keyword arguments:
+            path -- (node, child's index) from the root to the inner node
+        """
+        node, _ = path.pop()
+
+        # If node is root...
+        if not path:
+            if node.n_keys == 0:
+                # Remove a level from tree, child becomes the root
+                self.__set_root(self.__get_node(node.children[0]))
+                self.__free(node.pos)
+            else:
+                self.__save(node)
+
+            return
+
+        if node.n_keys >= self.min_inner:
+            self.__save(node)
+            return
+
+        father, i = path[-1]
+
+        # Father's key goes down, left brother's last key goes up
+        if i > 0:
+            left = self.__get_node(father.children[i - 1])
+
+            if left.n_keys > self.min_inner:
+                node.keys.insert(0, father.keys[i - 1])
+                node.children.insert(0, left.children.pop())
+                father.keys[i - 1] = left.keys.pop()
+
+                # Save on-disk
+                self.__save(left)
+                self.__save(node)
+                self.__save(father)
+                return
+
+        # Father's key goes down, right brother's first key goes up
+        if i < father.n_keys:
+            right = self.__get_node(father.children[i + 1])
+
+            if right.n_keys > self.min_inner:
+                node.keys.append(father.keys[i])
+                node.children.append(right.children.pop(0))
+                father.keys[i] = right.keys.pop(0)
+
+                # Save on-disk
+                self.__save(right)
+                self.__save(node)
+                self.__save(father)
+                return
+
+        # No brother is able to lose a key, join the right one into the left one
+        if i > 0:
+            right = node
+            i -= 1
+        else:
+            left = node
+
+        left.keys.append(father.keys[i])
+        left.keys.extend(right.keys)
+        left.children.extend(right.children)
+
+        self.__save(left)
+        self.__free(right.pos)
+
+        # Father loses the key between them
+        del father.keys[i]
+        del father.children[i + 1]
+
+        self.__shrink(path)
+
+    def __bulk_leaf(self, level, items, last):
+        """Append a leaf built by bulk_load, linked to its neighbours,
+        which are appended right before and after it.
+
+        Keyword arguments:
+            level -- leaves' first keys and positions
+            items -- leaf's (key, value) pairs
+            last -- if True, there is no next leaf
+        """
+        pos = self.__file.length
+        prev = level[-1][1] if level else 0
+        nxt = 0 if last else pos + self.node_len
+
+        keys = [k for k, _ in items]
+        values = [v for _, v in items]
+
+        self.__write(self.__layout.node(pos, keys, values, (), prev, nxt))
+        level.append((keys[0], pos))
+
+    def __bulk_level(self, level, fill):
+        """Append the inner nodes above a level built by bulk_load.
+
+        Return their first keys and positions, the level above.
+
+        Keyword arguments:
+            level -- nodes' first keys and positions
+            fill -- number of keys per inner node
+        """
+        # Each inner node has fill + 1 children
+        groups = [level[i:i + fill + 1] for i in range(0, len(level), fill + 1)]
+
+        # Balance an underflowing last node with its left brother
+        if len(groups) > 1 and len(groups[-1]) < self.min_inner + 1:
+            children = groups[-2] + groups[-1]
+
+            if len(children) <= self.max_inner + 1:
+                groups[-2:] = [children]
+            else:
+                i = len(children) // 2
+                groups[-2:] = [children[:i], children[i:]]
+
+        upper = []
+
+        for group in groups:
+            # A child's first key separates it from its left brother
+            node = self.__layout.node(self.__file.length, [k for k, _ in group[1:]], (), [p for _, p in group])
+            self.__write(node)
+
+            upper.append((group[0][0], node.pos))
+
+        return upper
+
+    def __check(self, node, lo, hi, depth, leaves):
+        """Check node's subtree, whose keys are in [lo, hi), and collect its
+        leaves with their depths.
+
+        Keyword arguments:
+            node -- a node
+            lo -- smallest key (None, no bound)
+            hi -- key after the greatest one (None, no bound)
+            depth -- node's depth
+            leaves -- list of (depth, leaf) found so far
+        """
+        node = self.__get_node(node)
+        keys = list(node.keys)
+
+        # Keys in order and between bounds
+        if any(a >= b for a, b in zip(keys, keys[1:])):
+            raise ValueError('Node #{} with keys out of order.'.format(node.pos))
+
+        if keys and ((lo is not None and keys[0] < lo) or (hi is not None and keys[-1] >= hi)):
+            raise ValueError('Node #{} with keys out of its father\'s bounds.'.format(node.pos))
+
+        # Number of keys, the root has no minimum
+        least, most = (self.min_keys, self.max_keys) if node.is_leaf else (self.min_inner, self.max_inner)
+
+        if node.pos == self.root.pos:
+            least = 0 if node.is_leaf else 1
+
+        if not least <= node.n_keys <= most:
+            raise ValueError('Node with {} keys. Interval should be [{}, {}] keys.'.format(node.n_keys,
+                                                                                           least, most))
+
+        if node.is_leaf:
+            leaves.append((depth, node))
+            return
+
+        # Number of children
+        if node.n_children != node.n_keys + 1:
+            raise ValueError('Node with {} keys and {} children'.format(node.n_keys, node.n_children))
+
+        # Child i has the keys between keys i - 1 and i
+        bounds = [lo] + keys + [hi]
+
+        for i, child in enumerate(node.children):
+            self.__check(child, bounds[i], bounds[i + 1], depth + 1, leaves)
@@ -1,719 +1,2238 @@
-from pystrct import StructFile
-from itertools import chain
-from .pysearch import search
+import os
+from array import array
+from functools import partial
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from .layout import Node, Layout, SlottedLayout, Overflow, VARIABLE
+from .storage import STORAGES, NodeFile, MmapNodeFile
+from .cache import NodeCache
+from .wal import WriteAheadLog, LoggedNodeFile
+from .build import spread, partition, write_leaves
+from .lock import RWLock, NoLock, FileLock, reading, writing
+from .stats import Stats, measured
+from .bloom import BloomFilter, encoder
+from .header import (MAGIC, VERSION, HEADER_LEN, H_ORDER, H_ROOT, H_N_FREE, H_KEY_CODE,
+                     H_VALUE_CODE, H_PAGE_SIZE, H_KIND, H_GENERATION, BTREE,
+                     new_header, header_format, read_header, write_header, trim, allocate, free, set_root)
+
+
+# Nodes up to this many slots apart are read at once when warming
+WARM_GAP = 4
 
 
-class Node():
-    """Represent a Node in BTree.
+class BTree():
+    """Represent a on-disk BTree implementation.
+
+    Properties:
+        root -- a Node as root tree
+        order -- BTree order (default 60)
+        n_free -- number of free node slots in file
+        lock -- the readers-writer lock (a NoLock, if not concurrent), in a
+                FileLock if shared
+        stats -- counters of events and latencies (None, if disabled)
+    """
+
+    def __init__(self, filepath, order=60, **kwargs):
+        """Construct a tree.
+
+        Keyword argument:
+            filepath -- path to save BTree
+            order -- BTree order (default 60)
+            storage -- {'mmap', (default 'file')} how nodes are read/written
+            cache_nodes -- number of nodes kept in memory (default 0)
+            wal -- if True, log every operation before changing the file (default False)
+            group_commit -- number of operations per log sync, with wal (default 1)
+            checkpoint -- log's size in bytes that triggers a checkpoint, with wal (default 16MiB)
+            key_format -- keys' format: an int, float or '<size>s' struct format, or
+                          'bytes'/'str' for variable-length keys in slotted pages (default 'i')
+            value_format -- values' format, same options as keys (default 'i')
+            page_size -- slotted page's size in bytes, for 'bytes'/'str' formats (default 4096)
+            concurrent -- if True, many threads may read while one writes (default False)
+            shared -- if True, many processes may read while one writes, through a
+                      '<filepath>-lock' file (default False)
+            stats -- if True, count events and time each operation (default False)
+            trace -- function called after each operation with its name, latency in
+                     seconds and a Counter of its events, stats are on (default None)
+            bloom -- number of keys a Bloom filter of keys is sized for, kept in a
+                     '<filepath>-bloom' file (default 0, no filter)
+            bloom_error -- filter's false positive rate with bloom keys (default 0.01)
+        """
+        # Get storage backend
+        storage = kwargs.get('storage', 'file')
+
+        if storage not in STORAGES:
+            raise ValueError('Unknown storage {}. Options are {}.'.format(repr(storage),
+                                                                         sorted(STORAGES)))
+
+        # Events and latencies of each operation
+        trace = kwargs.get('trace')
+        self.stats = Stats(lambda: self.height, trace) if kwargs.get('stats', False) or trace else None
+
+        # Write-ahead log's options
+        self.__wal = kwargs.get('wal', False)
+        self.__group_commit = kwargs.get('group_commit', 1)
+        self.__checkpoint = kwargs.get('checkpoint', 1 << 24)
+
+        # Readers share the tree, a writer has it alone
+        self.__concurrent = kwargs.get('concurrent', False)
+        self.__shared = kwargs.get('shared', False)
+        self.lock = RWLock() if self.__concurrent else NoLock()
+
+        # Header is read once the file is locked
+        self.__header = None
+        self.__changed = False      # written since the file was locked
+
+        # Other processes lock the file too
+        if self.__shared:
+            # Other processes would not see the logged changes
+            if self.__wal:
+                raise ValueError('A shared BTree cannot have a write-ahead log.')
+
+            # Nor would their keys be in the filter
+            if kwargs.get('bloom', 0) > 0:
+                raise ValueError('A shared BTree cannot have a Bloom filter.')
+
+            self.lock = FileLock(filepath + '-lock', self.lock, self.__refresh, self.__publish)
+
+        self.__filepath = filepath
+        self.__storage = STORAGES[storage]
+
+        # A shared mapping has no spare bytes, other processes would read them
+        if self.__shared and self.__storage is MmapNodeFile:
+            self.__storage = partial(MmapNodeFile, chunk=0)
+
+        with self.lock.write():
+            # File as the filter was saved with, before a mapping resizes it
+            stamp = self.__stamp() if os.path.exists(filepath) else None
+
+            # Open file with tree
+            self.__file = self.__open()
+
+            # Keep the most recently used nodes in memory
+            cache_nodes = kwargs.get('cache_nodes', 0)
+            self.__cache = NodeCache(cache_nodes, self.__evict) if cache_nodes > 0 else None
+
+            # Nodes saved during a batch, by position
+            self.__pending = {}
+            self.__depth = 0
+            self.__txn = False
+            self.__closed = False
+
+            # Keys that may be in tree, checked before going down
+            self.__bloom = None
+
+            # Read header and root only, other nodes are read when needed
+            self.__bootstrap(order, kwargs.get('key_format', 'i'), kwargs.get('value_format', 'i'),
+                             kwargs.get('page_size', 4096))
+
+            if kwargs.get('bloom', 0) > 0:
+                self.__bloom = BloomFilter(filepath + '-bloom', encoder(self.key_format),
+                                           kwargs['bloom'], kwargs.get('bloom_error', 0.01))
+
+                # An outdated filter would miss keys, so it is built again
+                if not (stamp and self.__bloom.load(*stamp)):
+                    self.__fill_bloom(self.__bloom.capacity)
+
+    @property
+    def order(self):
+        return self.__order
+
+    @property
+    def n_free(self):
+        return self.__header[H_N_FREE]
+
+    @property
+    def key_format(self):
+        return self.__layout.key_format
+
+    @property
+    def value_format(self):
+        return self.__layout.value_format
+
+    @property
+    def page_size(self):
+        """Return the slotted page's size in bytes. None, if nodes have fixed records."""
+        return self.__layout.page_size if self.__layout.variable else None
+
+    @property
+    def cache(self):
+        """Return the node cache (with hit/miss counters). None, if disabled."""
+        return self.__cache
+
+    @property
+    def bloom(self):
+        """Return the Bloom filter (with its size and expected error). None, if disabled."""
+        return self.__bloom
+
+    @property
+    def height(self):
+        """Return the number of levels in tree (1, if the root is a leaf)."""
+        with self.lock.read():
+            node = self.root
+            height = 1
+
+            # Every leaf is at the same depth
+            while not node.is_leaf:
+                node = self.__get_node(node.children[0])
+                height += 1
+
+            return height
+
+    @property
+    def storage(self):
+        """Return the main file (with I/O counters). Compacting opens a new one."""
+        return getattr(self.__file, 'storage', self.__file)
+
+    @property
+    def max_keys(self):
+        return self.__order * 2
+
+    @property
+    def min_keys(self):
+        return self.__order
+
+    @property
+    def max_children(self):
+        return self.max_keys + 1
+
+    @property
+    def min_children(self):
+        return self.__order + 1
+
+    @property
+    def node_len(self):
+        return self.__layout.node_len
+
+    @measured
+    @writing
+    def insert(self, key, value):
+        """Insert key,value in the BTree. If key exists, its value is replaced.
+
+        Keyword arguments:
+            key -- key to be inserted
+            value -- key's value
+        """
+        self.__put(key, value)
+
+    @measured
+    @writing
+    def insert_many(self, items):
+        """Insert many key,value pairs at once.
+
+        Pairs are inserted in key order. Neighbouring keys share the way
+        down to their leaf and each changed node is written once. If a key
+        exists, its value is replaced (by the last pair, if key repeats).
+
+        Keyword arguments:
+            items -- an iterable of (key, value) pairs
+        """
+        items = sorted(((self.__key(key), value) for key, value in items), key=lambda x: x[0])
+        leaf = None
+
+        for key, value in items:
+            self.__layout.check(key, value)
+
+        with self.__batch():
+            for key, value in items:
+                # Go down again only if key is out of the last leaf
+                if leaf is None or not self.__in_bounds(key, lo, hi):
+                    path, leaf, lo, hi = self.__find_leaf(key)
+
+                i = leaf.find(key)
+
+                # Every key between the bounds is in leaf, a bound is in an ancestor
+                if i is not None:
+                    changed = self.__replace(path, leaf, i, value)
+                elif self.__in_bounds(key, lo, hi):
+                    changed = self.__insert_leaf(path, leaf, key, self.__spill(value))
+                else:
+                    # Ancestors in path are not the nodes changed, so they are read again
+                    self.__replace(*self.__find(key), value)
+                    changed = True
+
+                # A split changes the leaf's bounds
+                if changed:
+                    leaf = None
+
+    @measured
+    @writing
+    def update(self, key, value):
+        """Replace an existing key's value. Only the value is written, the
+        tree's shape does not change (but for slotted pages, if the value's
+        size does).
+
+        Return True, if key was found. False, otherwise (nothing is inserted).
+
+        Keyword arguments:
+            key -- key to be updated
+            value -- key's new value
+        """
+        key = self.__key(key)
+        self.__layout.check(key, value)
+
+        if self.__missing(key):
+            return False
+
+        path, node, i = self.__find(key)
+
+        if i is None:
+            return False
+
+        with self.__batch():
+            self.__replace(path, node, i, value)
+
+        return True
+
+    @measured
+    @writing
+    def upsert(self, key, value):
+        """Replace key's value, if key exists. Insert key,value, otherwise.
+
+        Return True, if key existed. False, if it was inserted.
+
+        Keyword arguments:
+            key -- key to be updated or inserted
+            value -- key's value
+        """
+        return self.__put(key, value)
+
+    @measured
+    @writing
+    def get_or_insert(self, key, value):
+        """Return key's value, if key exists. Insert key,value and return
+        value, otherwise.
+
+        Keyword arguments:
+            key -- key to be searched
+            value -- value inserted, if key does not exist
+        """
+        key = self.__key(key)
+        self.__layout.check(key, value)
+
+        path, node, i = self.__find(key)
+
+        if i is not None:
+            return self.__value(node.values[i])
+
+        with self.__batch():
+            self.__insert_leaf(path, node, key, self.__spill(value))
+
+        return value
+
+    @measured
+    @writing
+    def delete(self, key):
+        """Delete a key from the BTree.
+
+        Keyword arguments:
+            key -- key to be deleted
+        """
+        key = self.__key(key)
+
+        if self.__missing(key):
+            return
+
+        # Search node with key
+        path, node, i = self.__find(key)
+
+        # Key was not found
+        if i is None:
+            return
+
+        with self.__batch():
+            # Long values' pages are freed with the key
+            value = node.values[i]
+
+            # Here, we found the node with key
+            # If node is not a leaf, replace key by its successor and remove that from its leaf
+            if not node.is_leaf:
+                # Successor is the smallest key in the right subtree
+                depth = len(path)
+                path.append((node, i + 1))
+                leaf = self.__get_node(node.children[i + 1])
+
+                while not leaf.is_leaf:
+                    path.append((leaf, 0))
+                    leaf = self.__get_node(leaf.children[0])
+
+                # Replace key
+                node.set_key(i, *leaf.item(0))
+
+                # Save changes on-disk
+                self.__save(node)
+
+                # A longer key may not fit in a slotted page anymore
+                if self.__layout.overflows(node):
+                    self.__split(path[:depth], node)
+
+                    # Leaf's ancestors may have changed
+                    path = self.__path(leaf)
+
+                # Update node
+                node = leaf
+                i = 0
+
+            # Just remove
+            node.remove_key(i)
+            self.__save(node)
+
+            # If leaf has less keys then the minimum (underflow)...
+            if path and self.__layout.underflows(node):
+                # Rotate or join
+                self.__rotajoin(path, node)
+
+            self.__free_value(value)
+
+    @measured
+    @writing
+    def delete_many(self, keys):
+        """Delete many keys at once.
+
+        Keys are deleted in order. Neighbouring keys share the way down to
+        their leaf and each changed node is written once.
+
+        Keyword arguments:
+            keys -- an iterable of keys to be deleted
+        """
+        leaf = None
+
+        with self.__batch():
+            for key in sorted(set(map(self.__key, keys))):
+                if self.__missing(key):
+                    continue
+
+                # Go down again only if key is out of the last leaf
+                if leaf is None or not self.__in_bounds(key, lo, hi):
+                    _, leaf, lo, hi = self.__find_leaf(key)
+
+                i = leaf.find(key)  # leaf.key's index
+
+                # Every key between the bounds is in leaf, so key does not exist
+                if i is None and self.__in_bounds(key, lo, hi):
+                    continue
+
+                # Just remove, if leaf does not underflow
+                if i is not None and (leaf == self.root or self.__layout.can_lose(leaf, i)):
+                    self.__free_value(leaf.values[i])
+                    leaf.remove_key(i)
+                    self.__save(leaf)
+                    continue
+
+                # Key is in an inner node or leaf needs a rotation/join
+                self.delete(key)
+                leaf = None
+
+    @measured
+    @writing
+    def bulk_load(self, items, fill_factor=1.0):
+        """Fill an empty BTree from (key, value) pairs sorted by key.
+
+        Nodes are packed bottom-up and written sequentially in one pass,
+        holding at most two nodes per level in memory. Slotted pages hold
+        as many keys as fit, so they are filled by insert_many instead.
+
+        Keyword arguments:
+            items -- an iterable of (key, value) in strictly increasing key order
+            fill_factor -- fraction of max_keys put in each node (default 1.0)
+        """
+        if self.root.n_keys > 0:
+            raise ValueError('Only an empty BTree can be bulk loaded.')
+
+        if not 0 < fill_factor <= 1:
+            raise ValueError('Fill factor should be in (0, 1].')
+
+        if self.__layout.variable:
+            self.insert_many(self.__increasing(items))
+            return
+
+        # Number of keys per node, never less than the minimum
+        fill = int(round(fill_factor * self.max_keys))
+        fill = max(self.min_keys, min(self.max_keys, fill))
+
+        with self.__batch():
+            # Nodes being built in each level, leaves first
+            levels = []
+            last = None
+
+            for key, value in self.__increasing(items):
+                last = key
+                self.__bulk_key(levels, 0, (key, value), fill)
+
+                if self.__bloom is not None:
+                    self.__bloom.add(key)
+
+            if last is None:
+                return
+
+            items, children = self.__bulk_close(levels, fill)
+
+            # Top node becomes the root
+            keys = [k for k, _ in items]
+            values = [v for _, v in items]
+
+            self.root = self.__layout.node(self.root.pos, keys, values, children)
+            self.__write(self.root)
+
+            if self.__cache is not None:
+                self.__cache.clear()
+                self.__cache.put(self.root)
+
+    @measured
+    @writing
+    def build_parallel(self, source, workers=None, fill_factor=1.0):
+        """Fill an empty BTree from (key, value) pairs in any order, using
+        many processes.
+
+        Pairs are split by key range. Each worker process sorts its part and
+        writes it as a run of leaves, straight to its place in file. Then the
+        levels above the leaves are built here. Slotted pages are filled by
+        insert_many instead.
+
+        Keyword arguments:
+            source -- an iterable of (key, value) pairs with unique keys
+            workers -- number of worker processes (default os.cpu_count())
+            fill_factor -- fraction of max_keys put in each node (default 1.0)
+        """
+        if self.root.n_keys > 0:
+            raise ValueError('Only an empty BTree can be bulk loaded.')
+
+        if not 0 < fill_factor <= 1:
+            raise ValueError('Fill factor should be in (0, 1].')
+
+        if self.__txn:
+            raise ValueError('A BTree cannot be built in a transaction.')
+
+        items = [(self.__key(key), value) for key, value in source]
+        workers = workers or os.cpu_count() or 1
+
+        # Not worth the processes
+        if self.__layout.variable or workers == 1 or len(items) <= self.max_keys:
+            items.sort(key=lambda x: x[0])
+            self.bulk_load(items, fill_factor)
+            return
+
+        # Number of keys per node, never less than the minimum
+        fill = int(round(fill_factor * self.max_keys))
+        fill = max(self.min_keys, min(self.max_keys, fill))
+
+        if self.__bloom is not None:
+            for key, _ in items:
+                self.__bloom.add(key)
+
+        parts = partition(items, workers, self.max_keys)
+        del items
+
+        # Workers write to file, so it is closed meanwhile
+        self.flush()
+        length = self.__file.length
+
+        # Leaves go after the end of file, each part's run after the previous one.
+        # Slots in the free list are left there.
+        runs = []
+        pos = length
+
+        for i, part in enumerate(parts):
+            sizes = spread(len(part) - (i > 0), fill, self.max_keys)
+            runs.append((part, i > 0, pos, sizes))
+            pos += len(sizes) * self.node_len
+
+        self.__file.close()
+        results = None
+
+        try:
+            with ProcessPoolExecutor(min(workers, len(runs))) as pool:
+                jobs = [pool.submit(write_leaves, self.__filepath, self.key_format, self.value_format,
+                                    self.max_keys, self.max_children, *run) for run in runs]
+                results = [job.result() for job in jobs]
+        finally:
+            self.__file = self.__open()
+
+            # Runs of a failed build are cut off
+            if results is None and self.__file.length > length:
+                self.__file.truncate(self.__file.length - length)
+
+        # Leaves are not in the log, so they must be durable
+        # before a logged node points to them
+        if self.__wal:
+            self.__file.checkpoint()
+
+        # Leaves in key order, with the pairs between them
+        children = []
+        separators = []
+
+        for (_, _, pos, sizes), (head, between) in zip(runs, results):
+            if head is not None:
+                separators.append(head)
+
+            children.extend(range(pos, pos + len(sizes) * self.node_len, self.node_len))
+            separators.extend(between)
+
+        with self.__batch():
+            # Build each level above the leaves, until one node holds them all
+            while len(children) > self.max_children:
+                nodes = []
+                up = []
+                i = 0
+
+                for size in spread(len(separators), fill, self.max_keys):
+                    items = separators[i:i + size]
+
+                    node = self.__layout.node(self.__file.length, [k for k, _ in items],
+                                              [v for _, v in items], children[i:i + size + 1])
+                    self.__write(node)
+                    nodes.append(node.pos)
+                    i += size
+
+                    # Pair between this node and the next goes up
+                    if i < len(separators):
+                        up.append(separators[i])
+                        i += 1
+
+                children = nodes
+                separators = up
+
+            # Top node becomes the root
+            self.root = self.__layout.node(self.root.pos, [k for k, _ in separators],
+                                           [v for _, v in separators], children)
+            self.__write(self.root)
+
+            if self.__cache is not None:
+                self.__cache.clear()
+                self.__cache.put(self.root)
+
+    @measured
+    @reading
+    def search(self, key, node=None):
+        """Search a key in the BTree.
+
+        Return value, if key was found. None, otherwise.
+
+        Keyword arguments:
+            key -- key to be searched
+            node -- node to start the search from.
+        """
+        key = self.__key(key)
+
+        # Most missing keys need no read
+        if node is None and self.__missing(key):
+            return None
+
+        # If node is None, node = root
+        node = self.root if node is None else self.__get_node(node)
+
+        while True:
+            # Try to find a key in node.keys
+            i = node.find(key)
+
+            # Return key's value
+            if i is not None:
+                return self.__value(node.values[i])
+
+            # But if the current node is a leaf,
+            # there is no other node
+            if node.is_leaf:
+                return None
+
+            # Go down to the child that can have the key
+            node = self.__get_node(node.children[node.search(key)])
+
+    @measured
+    @reading
+    def search_many(self, keys):
+        """Search many keys at once.
+
+        Each node in the way down is read once for all keys that pass
+        through it.
+
+        Return a list of values (None for missing keys) in keys' order.
+
+        Keyword arguments:
+            keys -- an iterable of keys to be searched
+        """
+        keys = [self.__key(key) for key in keys]
+        found = {}
+
+        # Nodes to visit with the keys that go through them
+        stack = [(self.root, sorted(key for key in set(keys) if not self.__missing(key)))]
+
+        while stack:
+            node, group = stack.pop()
+            node = self.__get_node(node)
+            node_keys = node.keys
+
+            # Keys to search in each child
+            children = {}
+
+            for key in group:
+                i = bisect_left(node_keys, key)
+
+                if i < node.n_keys and node_keys[i] == key:
+                    found[key] = self.__value(node.values[i])
+                elif not node.is_leaf:
+                    children.setdefault(i, []).append(key)
+
+            stack.extend((node.children[i], group) for i, group in children.items())
+
+        return [found.get(key) for key in keys]
+
+    @measured
+    @reading
+    def range(self, lo=None, hi=None, reverse=False):
+        """Iterate over (key, value) pairs with lo <= key < hi, in key order.
+
+        Nodes are read lazily, each one once, and only the nodes on the way
+        from the root to the current key are kept in memory. The BTree
+        should not be changed while iterating.
+
+        Keyword arguments:
+            lo -- smallest key (default None, no bound)
+            hi -- key after the greatest one (default None, no bound)
+            reverse -- if True, iterate in descending order (default False)
+        """
+        lo = None if lo is None else self.__key(lo)
+        hi = None if hi is None else self.__key(hi)
+
+        if lo is not None and hi is not None and lo >= hi:
+            return
+
+        # Steps left in each node from the root to the current one
+        stack = [self.__steps(self.root, lo, hi, reverse)]
+
+        while stack:
+            step = next(stack[-1], None)
+
+            # Node is over, go back to its father
+            if step is None:
+                stack.pop()
+                continue
+
+            child, item = step
+
+            if child is None:
+                yield item[0], self.__value(item[1])
+            else:
+                stack.append(self.__steps(self.__get_node(child), lo, hi, reverse))
+
+    def items(self):
+        """Iterate over all (key, value) pairs in key order."""
+        return self.range()
+
+    def keys(self):
+        """Iterate over all keys in order."""
+        for key, _ in self.range():
+            yield key
+
+    def __iter__(self):
+        """Iterate over all keys in order."""
+        return self.keys()
+
+    @reading
+    def display(self, node=None, level=0):
+        """String representation of a BTree."""
+        if level == 0:
+            print("Order: {}".format(self.order))
+
+        # Nodes to print, children in order
+        stack = [(self.root if node is None else node, level)]
+
+        while stack:
+            node, level = stack.pop()
+            node = self.__get_node(node)
+
+            t = "\t" * level
+            header = t + "#{}, {} keys, {} children"
+            keys = t + "\tKeys: {}"
+            children = t + "\tChildren: {}"
+
+            print(header.format(node.pos, node.n_keys, node.n_children))
+            print(keys.format(str(node.items())))
+            print(children.format(str(list(node.children))))
+            print('-' * 60)
+
+            stack.extend((child, level + 1) for child in reversed(node.children))
+
+    @reading
+    def check(self, node=None, workers=1):
+        """Return True if all nodes in tree follow the rules of a BTree.
+        Raise ValueError with every violation found and its node's position,
+        otherwise.
+
+        Each node is read once and checked against the keys around it in its
+        ancestors, so only the way down to the current node is kept.
+
+        Keyword arguments:
+            node -- node to start the check from (default None, the root)
+            workers -- number of threads checking the node's subtrees (default 1)
+        """
+        node = self.root if node is None else self.__get_node(node)
+
+        if workers > 1 and not node.is_leaf:
+            # The node itself, then each subtree in a thread
+            problems = self.__check_node(node, None, None)
+            depths = {}
+
+            with ThreadPoolExecutor(workers) as pool:
+                subtrees = pool.map(lambda args: self.__check_subtree(*args),
+                                    self.__check_children(node, None, None, 1))
+
+                for found, leaves in subtrees:
+                    problems.extend(found)
+
+                    for depth, positions in leaves.items():
+                        depths.setdefault(depth, []).extend(positions)
+        else:
+            problems, depths = self.__check_subtree(node, None, None, 0)
+
+        # Every leaf is in the same level, the one most leaves are in
+        if len(depths) > 1:
+            common = max(depths, key=lambda depth: len(depths[depth]))
+
+            for depth in sorted(depths):
+                if depth != common:
+                    problems.extend('#{}: Leaf at depth {}. Leaves should be at depth {}.'.format(pos, depth, common)
+                                    for pos in depths[depth])
+
+        if problems:
+            raise ValueError('{} violation(s) found:\n{}'.format(len(problems), '\n'.join(problems)))
+
+        # Return True, if every thing is OK
+        return True
+
+    @reading
+    def warm(self, levels=2):
+        """Load the top levels of the tree in the node cache.
+
+        Nodes of a level are read in position order and neighbouring nodes
+        are read at once, so a compacted tree, whose levels are one after
+        another in file, is read sequentially. Loading stops before the
+        cache is full.
+
+        Return the number of nodes loaded.
+
+        Keyword arguments:
+            levels -- number of levels, the root's included (default 2)
+        """
+        if self.__cache is None:
+            raise ValueError('Warming needs a node cache (cache_nodes > 0).')
+
+        level = [self.root]
+        n = 0
+
+        for _ in range(levels - 1):
+            positions = sorted(child for node in level for child in node.children)
+
+            if not positions or n + len(positions) > self.__cache.capacity:
+                break
+
+            level = self.__load_many(positions)
+            n += len(positions)
+
+        return n
+
+    @measured
+    @writing
+    def rebuild_bloom(self, capacity=None):
+        """Build the Bloom filter again from the keys in tree, so deleted
+        keys are not in it anymore. A tree that outgrew the filter gets a
+        larger one.
+
+        Keyword arguments:
+            capacity -- number of keys the filter is sized for (default None,
+                        its current capacity), at least the number of keys in tree
+        """
+        if self.__bloom is None:
+            raise ValueError('Rebuilding needs a Bloom filter (bloom > 0).')
+
+        self.__fill_bloom(capacity or self.__bloom.capacity)
+
+    @contextmanager
+    @writing
+    def transaction(self):
+        """Run a block of changes as a single operation.
+
+        Changed nodes are held in memory and written once, in file order,
+        when the block ends. If the block raises an exception, its changes
+        are thrown away. Inside the block, commit() and rollback() end the
+        changes made so far.
+        """
+        if self.__txn:
+            raise ValueError('A transaction is already open.')
+
+        # Changes made before the transaction are not part of it
+        self.flush()
+
+        # Hold writes in memory, so they can be thrown away
+        if not self.__wal:
+            self.__file = LoggedNodeFile(self.__file)
+
+        self.__txn = True
+        self.__depth += 1
+
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        else:
+            self.commit()
+        finally:
+            self.__depth -= 1
+            self.__txn = False
+
+            if not self.__wal:
+                self.__file = self.__file.storage
+
+    @writing
+    def commit(self):
+        """Write all changes made in the current transaction."""
+        if not self.__txn:
+            raise ValueError('There is no transaction open.')
+
+        self.__commit()
+
+    @writing
+    def rollback(self):
+        """Throw away all changes made in the current transaction."""
+        if not self.__txn:
+            raise ValueError('There is no transaction open.')
+
+        self.__pending.clear()
+        self.__file.rollback()
+
+        # Cached nodes may have been changed
+        if self.__cache is not None:
+            self.__cache.clear()
+
+        # Get header and root as they were
+        self.__header = self.__read_header()
+        self.root = self.__load(self.__header[H_ROOT])
+
+    @measured
+    @writing
+    def compact(self):
+        """Rewrite the tree without free slots, shrinking the file.
+
+        Nodes are copied level by level from the root into a new file, which
+        then replaces the old one. Only shared trees see the new file in
+        other processes, others should not have the file open meanwhile.
+        """
+        if self.__txn:
+            raise ValueError('A BTree cannot be compacted in a transaction.')
+
+        self.flush()
+        self.__rewrite(self.root.pos)
+
+    @measured
+    @writing
+    def flush(self):
+        """Write all pending changes to disk."""
+        if self.__cache is not None:
+            self.__cache.flush()
+
+        self.__file.flush()
+
+    @measured
+    @writing
+    def checkpoint(self):
+        """Write all logged changes in file and erase the log. Without a
+        write-ahead log, it is the same as flush."""
+        self.flush()
+
+        if self.__wal:
+            self.__file.checkpoint()
+
+    def close(self):
+        """Write all pending changes to disk and close the file. Closing a
+        closed BTree does nothing."""
+        if self.__closed:
+            return
+
+        with self.lock.write():
+            self.flush()
+            self.__publish()
+            self.__file.close()
+
+            # Filter matches the file as it is now
+            if self.__bloom is not None:
+                self.__bloom.save(*self.__stamp())
+
+            # File is unlocked once the lock file is closed
+            if self.__shared:
+                self.lock.close()
+
+            # Everything is in file, log is not needed anymore
+            if self.__wal and os.path.exists(self.__filepath + '-wal'):
+                os.remove(self.__filepath + '-wal')
+
+            self.__closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __open(self):
+        """Open the tree's file, replaying the changes left in its log by a
+        crash. Return the storage, wrapped in a new log if wal is on."""
+        storage = self.__storage(self.__filepath, 'i')
+        log = self.__filepath + '-wal'
+
+        if os.path.exists(log):
+            wal = WriteAheadLog(log)
+
+            # Committed operations were not all in file yet
+            if wal.replay(storage.write) > 0:
+                storage.sync()
+
+            wal.close()
+            os.remove(log)
+
+        if not self.__wal:
+            return storage
+
+        return LoggedNodeFile(storage, WriteAheadLog(log),
+                              self.__group_commit, self.__checkpoint)
+
+    def __stamp(self):
+        """Return the tree file's size and modification time, which tell
+        if the Bloom filter saved with it is up to date."""
+        stat = os.stat(self.__filepath)
+        return stat.st_size, stat.st_mtime_ns
+
+    def __commit(self):
+        """End an operation. Write each pending node once, in file order.
+        With wal or in a transaction, commit every change made by it."""
+        pending, self.__pending = self.__pending, {}
+
+        for pos in sorted(pending):
+            self.__store(pending[pos])
+
+        # Cached changes are part of the operation.
+        # Readers in other threads should never have to write them.
+        if self.__cache is not None and (self.__wal or self.__txn or self.__concurrent):
+            self.__cache.flush()
+
+        if self.__wal or self.__txn:
+            self.__file.commit()
+
+        self.__changed = True
+
+    def __refresh(self):
+        """See the changes made by other processes. Called once the file is
+        locked."""
+        # Tree is still being opened
+        if self.__header is None:
+            return
+
+        header = self.__read_header()
+
+        if header[H_GENERATION] == self.__header[H_GENERATION]:
+            return
+
+        # Another process compacted the tree into a new file
+        if self.__file.replaced():
+            self.__file.close()
+            self.__file = self.__open()
+            header = self.__read_header()
+        else:
+            self.__file.refresh()
+
+        # Nodes in memory may be outdated
+        if self.__cache is not None:
+            self.__cache.clear()
+
+        self.__header = header
+        self.root = self.__load(header[H_ROOT])
+
+    def __publish(self):
+        """Show this process' changes to other processes, by writing all of
+        them and a new generation. Called before the file is unlocked."""
+        if not self.__shared or not self.__changed:
+            return
+
+        self.__changed = False
+
+        if self.__cache is not None:
+            self.__cache.flush()
+
+        self.__header[H_GENERATION] = self.__next_generation()
+        self.__write_header()
+
+    def __next_generation(self):
+        """Return the generation after the current one."""
+        # Legacy files have no header yet
+        if self.__header is None:
+            return 0
+
+        return (self.__header[H_GENERATION] + 1) & 0x7fffffff
+
+    def __bootstrap(self, order, key_format, value_format, page_size):
+        """Get root from file if exists. Create, otherwise."""
+        # Get tree's header
+        first = self.__read(0, 1)
+
+        if first is None:  # there is no data in file
+            self.__order = order
+            self.__layout = self.__new_layout(key_format, value_format, page_size)
+            self.__header = self.__new_header()
+            self.__write_header()
+
+            # Save an empty root
+            self.root = self.__layout.node(HEADER_LEN)
+            self.__save(self.root)
+            self.__commit()
+            return
+
+        first = self.__file.block(1).unpack(first)[0]
+
+        if first != MAGIC:
+            # Old file with no header: order, then root
+            self.__order = first
+            self.__layout = Layout('i', 'i', self.max_keys, self.max_children)
+            self.__rewrite(1)
+            return
+
+        self.__header = self.__read_header()
+
+        if self.__header[1] > VERSION:
+            raise ValueError('Unsupported file version {}.'.format(self.__header[1]))
+
+        if self.__header[H_KIND] != BTREE:
+            raise ValueError('File has a B+ tree. Open it with BPlusTree.')
+
+        # Set order and record layout, files before version 2 have int keys and values
+        self.__order = self.__header[H_ORDER]
+        self.__layout = self.__new_layout(self.__format(H_KEY_CODE), self.__format(H_VALUE_CODE),
+                                          self.__header[H_PAGE_SIZE])
+
+        # Drop spare cells left by an unclean close
+        self.__trim()
+
+        # Get root
+        self.root = self.__load(self.__header[H_ROOT])
+
+    def __new_layout(self, key_format, value_format, page_size):
+        """Return slotted pages, if keys or values have variable length.
+        Fixed records, otherwise.
+
+        Keyword arguments:
+            key_format -- keys' format
+            value_format -- values' format
+            page_size -- slotted page's size in bytes
+        """
+        if key_format in VARIABLE or value_format in VARIABLE:
+            return SlottedLayout(key_format, value_format, page_size)
+
+        return Layout(key_format, value_format, self.max_keys, self.max_children)
+
+    def __new_header(self):
+        """Return the header of a file with no free slot."""
+        page_size = self.__layout.page_size if self.__layout.variable else 0
+
+        return new_header(BTREE, self.__order, self.key_format, self.value_format, page_size)
+
+    def __format(self, i):
+        """Return the format saved in the ith header's cell.
+
+        Keyword arguments:
+            i -- index of format's code
+        """
+        return header_format(self.__header, i)
+
+    def __read_header(self):
+        """Read header from file."""
+        return read_header(self.__file, self.__read)
+
+    def __write_header(self):
+        """Write header in file."""
+        write_header(self.__file, self.__header, self.__write_cells)
+
+    def __set_root(self, node):
+        """Set node as root and save its position in header.
+
+        Keyword arguments:
+            node -- the new root
+        """
+        self.root = node
+        set_root(self.__file, self.__header, node.pos, self.__write_cells)
+
+        # Root moved to another node
+        if self.stats is not None:
+            self.stats.count('relocations')
+
+    def __rewrite(self, pos):
+        """Copy the tree whose root is in pos to a new file, with no free
+        slot, and replace the current file by it.
+
+        Keyword arguments:
+            pos -- root's position in current file
+        """
+        temp = self.__filepath + '.compact'
+
+        if os.path.exists(temp):
+            os.remove(temp)
+
+        out = NodeFile(temp, 'i')
+
+        header = self.__new_header()
+        header[H_GENERATION] = self.__next_generation()
+        write_header(out, header, out.write)
+
+        # Nodes are written in the order they are visited, level by level,
+        # so children's new positions are known when their father is written
+        queue = deque([(pos, HEADER_LEN)])      # (old, new) positions
+        nxt = HEADER_LEN + self.node_len        # next free position
+
+        while queue:
+            old, pos = queue.popleft()
+            node = self.__load(old)
+
+            n = node.n_children
+            children = range(nxt, nxt + n * self.node_len, self.node_len)
+
+            queue.extend(zip(node.children, children))
+            nxt += n * self.node_len
+
+            # Long values' pages go right after node's children
+            if self.__layout.variable:
+                for i, value in enumerate(node.values):
+                    if type(value) is Overflow:
+                        node.values[i], nxt = self.__copy_value(out, value, nxt)
+
+            node.pos = pos
+            node.children = array('i', children)
+
+            data = self.__layout.pack(node)
+            out.write(pos, data)
+
+            # Node moved to another position in the new file
+            if self.stats is not None:
+                self.stats.count('bytes_written', len(data))
+                self.stats.count('relocations', old != pos)
+
+        out.close()
+
+        # Other processes see a new generation in the old file and open the new one
+        if self.__shared:
+            self.__header[H_GENERATION] = header[H_GENERATION]
+            self.__write_header()
+
+        # Replace file
+        self.__file.close()
+        os.replace(temp, self.__filepath)
+        self.__file = self.__open()
+
+        # Positions changed, forget every node in memory
+        if self.__cache is not None:
+            self.__cache.clear()
+
+        self.__pending.clear()
+
+        self.__header = header
+        self.root = self.__load(HEADER_LEN)
+        self.__changed = True
+
+    def __trim(self):
+        """Truncate spare cells left after the last node by an unclean close."""
+        trim(self.__file, self.node_len, self.__read)
+
+    def __load(self, pos):
+        """Load a node's data from file and return a Node object.
+
+        Keyword argument:
+            pos -- node's index in file
+        """
+        if self.stats is not None:
+            self.stats.count('loads')
+
+        # Read the whole node at once
+        node = self.__layout.unpack(self.__read(pos, self.node_len))
+
+        # Return a Node object
+        return node
+
+    def __load_many(self, positions):
+        """Load nodes in the node cache and return them, reading each run of
+        neighbouring nodes at once.
+
+        Keyword argument:
+            positions -- nodes' positions, sorted
+        """
+        nodes = {}
+        missing = []
+
+        # Nodes in memory may be newer than in file
+        for pos in positions:
+            node = self.__pending.get(pos)
+
+            if node is None:
+                node = self.__cache.get(pos)
+
+            if node is not None:
+                nodes[pos] = node
+            else:
+                missing.append(pos)
+
+        # Held writes are only seen by a read that starts where they start
+        step = 0 if isinstance(self.__file, LoggedNodeFile) else WARM_GAP
+        size = self.node_len * self.__file.cell
+        i = 0
+
+        while i < len(missing):
+            # Nodes up to step slots apart are read together
+            j = i + 1
+
+            while j < len(missing) and missing[j] - missing[j - 1] <= step * self.node_len:
+                j += 1
+
+            start = missing[i]
+            data = self.__read(start, missing[j - 1] + self.node_len - start)
+
+            for pos in missing[i:j]:
+                offset = (pos - start) * self.__file.cell
+                nodes[pos] = self.__layout.unpack(data[offset:offset + size])
+                self.__cache.put(nodes[pos])
+
+                if self.stats is not None:
+                    self.stats.count('loads')
+
+            i = j
+
+        return [nodes[pos] for pos in positions]
+
+    def __get_node(self, node):
+        """Get a node. If node is a number, load from file.
+
+        Keyword arguments:
+            node -- a node
+        """
+        if isinstance(node, Node):
+            return node
+
+        # Changed during a batch, but not written yet
+        pending = self.__pending.get(node)
+
+        if pending is not None and pending.pos == node:
+            return pending
+
+        if self.__cache is None:
+            return self.__load(node)
+
+        # Look for node in cache first
+        cached = self.__cache.get(node)
+
+        if cached is None:
+            cached = self.__load(node)
+            self.__cache.put(cached)
+
+        return cached
+
+    def __save(self, node):
+        """Save node. If cached, it is written back later.
+
+        Keyword arguments:
+            node -- a node to be saved
+        """
+        # Wait for the batch to end
+        if self.__depth > 0 and node.pos < self.__file.length:
+            self.__pending[node.pos] = node
+            return
+
+        self.__store(node)
+
+    def __store(self, node):
+        """Write node, or cache it to be written back later.
 
-    Properties:
-        leaf -- If node is a leaf, True. Otherwise, False
-        n_keys -- number of keys in node
-        keys -- a list of tuples (key, value), ordered by key
-        children -- a list of child Nodes
-    """
-    def __init__(self, pos, **kwargs):
-        """Create a new Node representation.
+        Keyword arguments:
+            node -- a node to be stored
+        """
+        # New nodes go to disk, so the file grows
+        if self.__cache is None or node.pos >= self.__file.length:
+            self.__write(node)
+
+            if self.__cache is not None:
+                self.__cache.put(node)
+        else:
+            self.__cache.put(node, dirty=True)
+
+    def __evict(self, node):
+        """Write a node evicted from cache. A node saved in the current batch
+        is written when the batch ends, so it is only dropped.
 
         Keyword arguments:
-            pos -- node's position in file
-            keys -- node's keys (default [(0, 0)] * (order * 2))
-            children -- node's children (default [None] * (2 * order + 1))
+            node -- a node leaving the cache
         """
-        self.pos = pos
-        self.keys = kwargs.get('keys', [])
-        self.children = kwargs.get('children', [])
+        if node.pos not in self.__pending:
+            self.__write(node)
 
-    @property
-    def keys(self):
-        return self.__keys
+    def __write(self, node):
+        """Write node in file.
 
-    @keys.setter
-    def keys(self, other):
-        self.__keys = list(other)
-        self.__keys.sort(key=lambda x: x[0])
+        Keyword arguments:
+            node -- a node to be written
+        """
+        if self.stats is not None:
+            self.stats.count('saves')
 
-    @property
-    def children(self):
-        return self.__children
+        # Write node on-disk at once
+        self.__write_cells(node.pos, self.__layout.pack(node))
 
-    @children.setter
-    def children(self, other):
-        self.__children = list(other)
+    def __write_value(self, node, i):
+        """Write node's ith value alone in file.
 
-    @property
-    def is_leaf(self):
-        """Return True, if node is a leaf, i.e., has no child."""
-        return self.n_children == 0
+        Keyword arguments:
+            node -- a node
+            i -- value's index
+        """
+        if self.stats is not None:
+            self.stats.count('saves')
 
-    @property
-    def n_keys(self):
-        """Return the number of keys in node."""
-        return len(self.keys)
+        first, data = self.__layout.pack_value(node, i)
+        self.__write_cells(node.pos + first, data)
 
-    @property
-    def n_children(self):
-        """Return the number of keys in node."""
-        return len(self.children)
+    def __read(self, i, n):
+        """Read n cells starting from the ith, counting the bytes read.
 
-    def to_list(self):
-        """Convert Node to tuple."""
-        keys = chain.from_iterable(self.keys)                                # [(1,2), (3,4)] => [1,2,3,4]
-        children = [n.pos if type(n) is Node else n for n in self.children]  # node => node.pos
+        Keyword arguments:
+            i -- first cell's index
+            n -- number of cells to be read
+        """
+        data = self.__file.read(i, n)
 
-        # Position, # of keys, # of children, keys, children's position
-        return [self.pos, self.n_keys, self.n_children] + list(keys) + children
+        if self.stats is not None and data is not None:
+            self.stats.count('bytes_read', len(data))
 
-    def search(self, key):
-        """Search for a node with key.
+        return data
 
-        Return a child index.
+    def __write_cells(self, i, data):
+        """Write bytes starting from the ith cell, counting the bytes written.
 
         Keyword arguments:
-            key -- key to be search in node
+            i -- first cell's index
+            data -- bytes of whole cells
         """
-        # If node is leaf, there is no other path
-        if self.is_leaf:
-            return None
+        if self.stats is not None:
+            self.stats.count('bytes_written', len(data))
 
-        # Find the next node to key
-        for i in range(self.n_keys):
-            # If node.key > key
-            if self.keys[i][0] > key:
-                # Return left node, because key < node.key
-                return i
+        self.__file.write(i, data)
 
-        # Return most-right node, because key is greater than all keys
-        return self.n_keys
+    def __allocate(self):
+        """Return a position for a new node.
 
-    def append_key(self, key, value):
-        """Append a key to node.
+        A free slot is reused, if any. Otherwise, the node goes to the end of
+        file and should be saved before the next allocation.
+        """
+        return allocate(self.__file, self.__header, self.__read, self.__write_cells)
 
-        Keyword arguments:
-            key -- key to be appended
-            value -- key's value
+    def __free(self, pos):
+        """Put a node's (or an overflow page's) slot in the free list.
+
+        Keyword argument:
+            pos -- slot's position
         """
-        self.keys = self.__keys + [(key, value)]
+        free(self.__file, self.__header, pos, self.__write_cells)
+
+        # Forget node
+        if self.__cache is not None:
+            self.__cache.discard(pos)
+
+        self.__pending.pop(pos, None)
 
-    def append(self, key, value, child):
-        """Append a key,value with right child.
+    def __spill(self, value):
+        """Return value, if it fits in a node. Otherwise, write it in a
+        chain of overflow pages and return its Overflow.
+
+        An overflow page holds its position, -2, the next page's position
+        (0, if it is the last) and a chunk of value's bytes.
 
         Keyword arguments:
-            key -- key to be appended
-            value -- key's value
-            child -- a Node object or int
+            value -- a value
         """
-        # Append key,value pair
-        self.append_key(key, value)
+        if self.__layout.inline(value):
+            return value
 
-        # Find pair's position in keys list
-        i = self.keys.index((key, value))
+        data = self.__layout.encode_value(value)
+        size = self.node_len * self.__file.cell - 12     # bytes per page
 
-        first_key = child.keys[0][0]
-        i = i + 1 if first_key > key else i
+        # Pages are written last first, so each one knows the next
+        nxt = 0
 
-        # Append child
-        self.__append_child(i, child)
+        for start in reversed(range(0, len(data), size)):
+            pos = self.__allocate()
+            self.__write_cells(pos, self.__page(pos, nxt, data[start:start + size]))
+            nxt = pos
 
-    def remove_key(self, i):
-        """Remove the ith key.
+        return Overflow(nxt, len(data))
 
-        Keyword argument:
-            i -- key's index
+    def __page(self, pos, nxt, chunk):
+        """Return an overflow page's bytes.
+
+        Keyword arguments:
+            pos -- page's position
+            nxt -- next page's position (0, if it is the last)
+            chunk -- value's bytes in page
         """
-        del self.keys[i]
+        page = self.__file.block(3).pack(pos, -2, nxt) + chunk
+        return page + bytes(self.node_len * self.__file.cell - len(page))
 
-    def remove_child(self, i):
-        """Remove the ith child.
+    def __pages(self, value):
+        """Return the positions of an Overflow's pages and its bytes.
 
-        Keyword argument:
-            i -- child's index
+        Keyword arguments:
+            value -- an Overflow
         """
-        del self.children[i]
+        positions = []
+        chunks = []
+        pos = value.pos
 
-    def __append_child(self, i, child):
-        """Append a child to node.
+        while pos != 0:
+            page = self.__read(pos, self.node_len)
+            _, _, nxt = self.__file.block(3).unpack_from(page)
 
-        Keyword argument:
-            i -- index where child should be inserted
-            child -- a Node object or int
+            positions.append(pos)
+            chunks.append(page[12:])
+            pos = nxt
+
+        return positions, b''.join(chunks)[:value.length]
+
+    def __value(self, value):
+        """Return a value, read from its overflow pages if needed.
+
+        Keyword arguments:
+            value -- a value in a node
         """
-        children1 = self.children[0:i]    # children before child
-        children2 = self.children[i:]     # children after child
+        if type(value) is not Overflow:
+            return value
 
-        # New children list
-        self.children = children1 + [child] + children2
+        return self.__layout.decode_value(self.__pages(value)[1])
 
-    @classmethod
-    def object(cls, pos, keys, children):
-        """Create a Node object from params.
+    def __free_value(self, value):
+        """Free a value's overflow pages, if any.
 
-        Keyword argument:
-            pos -- node's file index
-            values -- a tuple with position, keys and children
+        Keyword arguments:
+            value -- a value removed from the tree
         """
-        # Node's (keys, values)
-        keys = list(zip(*[iter(keys)] * 2))
+        if type(value) is not Overflow:
+            return
 
-        # Return a Node object
-        return cls(pos, keys=keys, children=children)
+        for pos in self.__pages(value)[0]:
+            self.__free(pos)
 
-    def __eq__(self, other):
-        """Equal comparison between nodes."""
-        return self.pos == other.pos
+    def __copy_value(self, out, value, pos):
+        """Copy a value's overflow pages to another file, one after another.
 
-class BTree():
-    """Represent a on-disk BTree implementation.
+        Return the value's new Overflow and the next free position.
 
-    Properties:
-        root -- a Node as root tree
-        order -- BTree order (default 60)
-    """
-    root = Node(1)
+        Keyword arguments:
+            out -- the other file
+            value -- an Overflow
+            pos -- first page's position in out
+        """
+        positions, data = self.__pages(value)
+        new = Overflow(pos, value.length)
+        size = self.node_len * self.__file.cell - 12
 
-    def __init__(self, filepath, order=60, **kwargs):
-        """Construct a tree.
+        for n, start in enumerate(range(0, len(data), size), 1):
+            nxt = pos + self.node_len if n < len(positions) else 0
+            out.write(pos, self.__page(pos, nxt, data[start:start + size]))
+            pos += self.node_len
 
-        Keyword argument:
-            filepath -- path to save BTree
-            order -- BTree order (default 60)
+        return new, pos
+
+    def __key(self, key):
+        """Return key as it is saved, so it compares equal to the key read
+        back (e.g. a float of format 'f' in single precision).
+
+        Keyword arguments:
+            key -- a key
         """
-        # Open file with tree
-        self.__file = StructFile(filepath, 'i')
+        round_key = self.__layout.round_key
+        return key if round_key is None else round_key(key)
 
-        # Load BTree's first 2 levels
-        self.__bootstrap(order)
+    def __missing(self, key):
+        """Return True, if the Bloom filter tells key is not in tree, so it
+        is not searched.
 
-    @property
-    def order(self):
-        return self.__order
+        Keyword arguments:
+            key -- key to be searched
+        """
+        if self.__bloom is None or key in self.__bloom:
+            return False
 
-    @property
-    def max_keys(self):
-        return self.__order * 2
+        if self.stats is not None:
+            self.stats.count('filtered')
 
-    @property
-    def min_keys(self):
-        return self.__order
+        return True
 
-    @property
-    def max_children(self):
-        return self.max_keys + 1
+    def __fill_bloom(self, capacity):
+        """Empty the Bloom filter and add every key in tree to it. Nodes are
+        read once, unless tree has more keys than capacity, so the filter
+        is sized for them and they are read again.
 
-    @property
-    def min_children(self):
-        return self.__order + 1
+        Keyword arguments:
+            capacity -- number of keys the filter is sized for
+        """
+        self.__bloom.clear(capacity)
 
-    @property
-    def node_len(self):
-        return self.max_keys * 2 + self.max_children + 3
+        # Nodes to read, in any order
+        stack = [self.root]
 
-    def insert(self, key, value):
-        """Insert key,value in the BTree.
+        while stack:
+            node = self.__get_node(stack.pop())
+            stack.extend(node.children)
+
+            for key in node.keys:
+                self.__bloom.add(key)
+
+        if self.__bloom.n_keys > capacity:
+            self.__fill_bloom(self.__bloom.n_keys)
+
+    def __path(self, node):
+        """Return the way down to node, as (ancestor, child's index) pairs
+        from the root. Empty, for the root.
 
         Keyword arguments:
-            key -- key to be inserted
-            value -- key's value
+            node -- a node with at least one key
         """
-        # Search for a leaf that can have the key
+        path = []
         father = self.root
-        node = father
-        i = father.search(key)
 
-        while i is not None:
-            father = node
-            node = self.__get_node(node.children[i])
-            i = node.search(key)
+        # Node's first key leads to it
+        k = node.keys[0]
 
-        # Here, the leaf was already found
-        node.append_key(key, value)
+        while father.pos != node.pos:
+            i = father.search(k)
+            path.append((father, i))
+            father = self.__get_node(father.children[i])
 
-        # If node is full, we need to break into parts
-        if node.n_keys > self.max_keys:
-            self.__split(father, node)
-        else:
-            # Save on-disk
-            self.__save(node)
+        return path
 
-    def delete(self, key):
-        """Delete a key from the BTree.
+    def __check_subtree(self, node, lo, hi, depth):
+        """Check every node in a subtree, in depth-first order.
+
+        Return (violations, leaves' positions by depth).
 
         Keyword arguments:
-            key -- key to be deleted
+            node -- subtree's root
+            lo -- key before the subtree's keys (None, if there is no such key)
+            hi -- key after the subtree's keys (None, if there is no such key)
+            depth -- subtree's root depth
         """
-        # Search node with key
-        node = self.root                            # start from root
-        i = search(node.keys, key, lambda x: x[0])  # node.key's index
-        j = i + 1 if i is not None else None
+        problems = []
+        depths = {}
 
-        while i is None and not node.is_leaf:
-            father = node
-            j = node.search(key)
-            node = self.__get_node(node.children[j])
-            i = search(node.keys, key, lambda x: x[0])
+        # Nodes to check, with the keys around them
+        stack = [(node, lo, hi, depth)]
 
-        # Key was not found
-        if i is None:
-            return
+        while stack:
+            node, lo, hi, depth = stack.pop()
+            node = self.__get_node(node)
 
-        # Here, we found the node with key
-        # While node not a leaf, pass key to a leaf and then remove it
-        while not node.is_leaf:
-            k, v = node.keys[i]
-            child = node.children[i + 1]
+            problems.extend(self.__check_node(node, lo, hi))
 
-            # Swap keys
-            node.keys[i] = child.keys[0]
-            child.keys[0] = (k, v)
+            if node.is_leaf:
+                depths.setdefault(depth, []).append(node.pos)
+            else:
+                stack.extend(reversed(self.__check_children(node, lo, hi, depth + 1)))
 
-            # Save changes on-disk
-            self.__save(node)
+        return problems, depths
 
-            # Update node
-            father = node
-            node = child
-            i = 0
+    def __check_children(self, node, lo, hi, depth):
+        """Return each child of node with the keys around it.
 
-        # Just remove
-        node.remove_key(i)
-        self.__save(node)
+        Keyword arguments:
+            node -- a node
+            lo -- key before node's keys
+            hi -- key after node's keys
+            depth -- children's depth
+        """
+        bounds = [lo] + list(node.keys) + [hi]
+        return [(child, bounds[i], bounds[i + 1], depth) for i, child in enumerate(node.children)]
 
-        # If leaf has less keys then the minimum (underflow)...
-        if node != self.root and node.n_keys < self.min_keys:
-            # Rotate or join
-            self.__rotajoin(father, node, j)
+    def __check_node(self, node, lo, hi):
+        """Return the violations in a single node.
 
-    def search(self, key, node=None):
-        """Search a key in the BTree.
+        Keyword arguments:
+            node -- a node
+            lo -- key before node's keys (None, if there is no such key)
+            hi -- key after node's keys (None, if there is no such key)
+        """
+        problems = []
+        where = '#{}: '.format(node.pos)
+
+        # Page's size, slotted pages have no minimum number of keys
+        if self.__layout.variable:
+            if self.__layout.overflows(node):
+                problems.append(where + 'Node with {} bytes. A page has {} bytes.'.format(self.__layout.used(node),
+                                                                                        self.page_size))
+        # Number of keys
+        elif not self.min_keys <= node.n_keys <= self.max_keys and node.pos != self.root.pos:
+            problems.append(where + 'Node with {} keys. Interval should be [{}, {}] keys.'.format(node.n_keys,
+                                                                                                self.min_keys,
+                                                                                                self.max_keys))
+
+        # Number of children
+        if not node.is_leaf and node.n_children != node.n_keys + 1:
+            problems.append(where + 'Node with {} keys and {} children'.format(node.n_keys, node.n_children))
+
+        keys = node.keys
+
+        # Keys in order, with no duplicate
+        if any(keys[i] >= keys[i + 1] for i in range(len(keys) - 1)):
+            problems.append(where + 'Keys out of order or duplicated.')
+
+        # Keys between the ancestors' keys around node
+        if lo is not None and keys and keys[0] <= lo:
+            problems.append(where + 'Child key less or equal than parent key.')
+
+        if hi is not None and keys and keys[-1] >= hi:
+            problems.append(where + 'Child key greater or equal than parent key.')
+
+        return problems
+
+    def __increasing(self, items):
+        """Yield checked (key, value) pairs, making sure keys are in
+        strictly increasing order.
 
-        Return value, if key was found. -1, otherwise.
+        Keyword arguments:
+            items -- an iterable of (key, value)
+        """
+        last = None
+
+        for key, value in items:
+            key = self.__key(key)
+
+            if last is not None and key <= last:
+                raise ValueError('Keys should be in strictly increasing order.')
+
+            self.__layout.check(key, value)
+
+            last = key
+            yield key, value
+
+    def __find_leaf(self, key):
+        """Search for a leaf that can have the key.
+
+        Return (path, leaf, lo, hi), where path is the way down to leaf as
+        (ancestor, child's index) pairs and lo and hi are the keys around
+        leaf's subtree in its ancestors (None, if there is no such key).
 
         Keyword arguments:
             key -- key to be searched
-            node -- node to start the search from.
         """
-        # If node is None, node = root
-        node = self.root if node is None else self.__get_node(node)
+        node = self.root
+        path = []
+        lo = hi = None
 
-        # Try to find a key in node.keys
-        i = search(node.keys, key, lambda x: x[0])
+        i = node.search(key)
 
-        # If didn't find, search in other node
-        if i is None:
-            # But if the current node is a leaf,
-            # there is no other node
-            if node.is_leaf:
-                return None
+        while i is not None:
+            # Narrow the bounds
+            if i > 0:
+                lo = node.keys[i - 1]
+            if i < node.n_keys:
+                hi = node.keys[i]
 
-            # Find node to search for the key
+            path.append((node, i))
+            node = self.__get_node(node.children[i])
             i = node.search(key)
-            node = node.children[i]
 
-            # Search for key
-            return self.search(key, node)
-        else:
-            # Return key's value
-            return node.keys[i][1]
+        return path, node, lo, hi
 
-    def display(self, node=None, level=0):
-        """String representation of a BTree."""
-        node = self.root if node is None else self.__get_node(node)
+    def __find(self, key):
+        """Search for the node with key.
 
-        t = "\t" * level
-        header = t + "#{}, {} keys, {} children"
-        keys = t + "\tKeys: {}"
-        children = t + "\tChildren: {}"
+        Return (path, node, i), where path is the way down to node as
+        (ancestor, child's index) pairs and i is key's index in node. If key
+        does not exist, node is the leaf that can have it and i is None.
 
-        pos = [self.__get_node(child).pos for child in node.children]
+        Keyword arguments:
+            key -- key to be searched
+        """
+        node = self.root        # start from root
+        i = node.find(key)      # node.key's index
+        path = []
 
-        if level == 0:
-            print("Order: {}".format(self.order))
+        while i is None and not node.is_leaf:
+            j = node.search(key)
+            path.append((node, j))
+            node = self.__get_node(node.children[j])
+            i = node.find(key)
 
-        print(header.format(node.pos, node.n_keys, node.n_children))
-        print(keys.format(str(node.keys)))
-        print(children.format(str(pos)))
-        print('-' * 60)
+        return path, node, i
 
-        for child in node.children:
-            self.display(child, level + 1)
+    def __put(self, key, value):
+        """Replace key's value, if key exists. Insert key,value, otherwise.
 
-    def check(self, node=None):
-        """Return True if all nodes in tree follow the rules of a BTree."""
-        node = self.root if node is None else self.__get_node(node)
+        Return True, if key existed.
 
-        # Number of keys
-        keys = node.n_keys >= self.min_keys and node.n_keys <= self.max_keys
-        if not keys and node.pos != self.root.pos:
-            raise ValueError('Node with {} keys. Interval should be [{}, {}] keys.'.format(node.n_keys,
-                                                                                           self.min_keys,
-                                                                                           self.max_keys))
-        # Number of children
-        if not node.is_leaf:
-            children = node.n_children == node.n_keys + 1
-            if not children:
-                raise ValueError('Node with {} keys and {} children'.format(node.n_keys, node.n_children))
+        Keyword arguments:
+            key -- key to be updated or inserted
+            value -- key's value
+        """
+        key = self.__key(key)
+        self.__layout.check(key, value)
 
-            # Children less than parent
-            for i in range(0, node.n_keys):
-                child = self.__get_node(node.children[i])
-                less = [k < node.keys[i][0] for k, _ in child.keys]
+        path, node, i = self.__find(key)
 
-                if not all(less):
-                    raise ValueError('Child key greater or equal than parent key.')
+        with self.__batch():
+            if i is None:
+                self.__insert_leaf(path, node, key, self.__spill(value))
+            else:
+                self.__replace(path, node, i, value)
 
-            # Last child greater than parent
-            i = node.n_keys
-            child = self.__get_node(node.children[i])
-            greater = [k > node.keys[-1][0] for k, _ in child.keys]
+        return i is not None
 
-            if not all(greater):
-                raise ValueError('Child key less or equal than parent key.')
+    def __replace(self, path, node, i, value):
+        """Replace node's ith value. A fixed record has only its value's
+        cells written. A slotted page is split or joined, if the new value's
+        size makes it overflow or underflow.
 
-        # Check recursively
-        other = [self.check(child) for child in node.children]
+        Return True, if tree's shape changed.
 
-        # Return True, if every thing is OK
-        return all(other)
+        Keyword arguments:
+            path -- the way down to node, as (ancestor, child's index) pairs
+            node -- a node
+            i -- value's index
+            value -- new value
+        """
+        old = node.values[i]
+        node.values[i] = self.__spill(value)
+        changed = False
+
+        if self.__layout.variable:
+            # A longer or shorter value changes the page's use
+            if self.__layout.overflows(node):
+                self.__split(path, node)
+                changed = True
+            else:
+                self.__save(node)
 
-    def __bootstrap(self, order):
-        """Get root from file if exists. Create, otherwise."""
-        # Get tree's order
-        o = self.__file.next()
+                if path and self.__layout.underflows(node):
+                    self.__rotajoin(path, node)
+                    changed = True
+        elif self.__cache is not None or node.pos in self.__pending or isinstance(self.__file, LoggedNodeFile):
+            # Node is written whole later anyway, a log holds whole nodes
+            self.__save(node)
+        else:
+            self.__write_value(node, i)
 
-        if o is not None:  # there is data in file
-            # Set order
-            self.__order = o
+        # Long values' pages are freed once they are replaced
+        self.__free_value(old)
+        return changed
 
-            # Get root's position
-            pos = self.__file.next()
-            self.root = self.__load(pos, True)
-        else:
-            self.__order = order            # set order
-            self.__file.append([order])     # save order
-            self.__save(self.root)          # save root
+    def __insert_leaf(self, path, node, key, value):
+        """Insert key,value in a leaf.
 
-    def __load(self, pos, ld_children=False):
-        """Load a node's data from file and return a Node object.
+        Return True, if leaf was split.
 
-        Keyword argument:
-            pos -- node's index in file
-            ld_children -- When True, load all node's children (default False)
+        Keyword arguments:
+            path -- the way down to leaf, as (ancestor, child's index) pairs
+            node -- leaf
+            key -- key to be inserted
+            value -- key's value
         """
-        n_keys = self.__file.get(pos + 1)      # get number of keys
-        n_children = self.__file.next()        # get number of children
+        if self.__bloom is not None:
+            self.__bloom.add(key)
 
-        # Get keys
-        keys = self.__file.get(self.__file.tell, n_keys * 2)
+        node.append_key(key, value)
 
-        # Get children
-        i = self.__file.tell + (self.max_keys - n_keys) * 2
-        children = self.__file.get(i, n_children)
+        # If node is full, we need to break into parts
+        if self.__layout.overflows(node):
+            self.__split(path, node)
+            return True
 
-        # Load children by its position
-        if ld_children:
-            children = [self.__load(p) for p in children]
+        # Save on-disk
+        self.__save(node)
+        return False
 
-        # Return a Node object
-        return Node.object(pos, keys, children)
+    @staticmethod
+    def __steps(node, lo, hi, reverse):
+        """Yield node's children and keys between lo and hi in order.
 
-    def __get_child(self, node, i):
-        """Get a node's child. If child is a number, load from file.
+        Each step is a tuple (child, None) or (None, (key, value)).
 
         Keyword arguments:
-            node -- node with child
-            i -- child's index in node
+            node -- a node
+            lo -- smallest key (None, no bound)
+            hi -- key after the greatest one (None, no bound)
+            reverse -- if True, yield in descending order
         """
-        # Short name
-        child = node.children[i]
+        keys = node.keys
 
-        # Save, if loaded
-        node.children[i] = self.__get_node(child)
+        # Keys in [a, b) are between bounds
+        a = 0 if lo is None else bisect_left(keys, lo)
+        b = node.n_keys if hi is None else bisect_left(keys, hi)
 
-        # Return loaded node
-        return node.children[i]
+        # Children in [first, b] may have keys between bounds
+        first = a + 1 if a < node.n_keys and keys[a] == lo else a
 
-    def __get_node(self, node):
-        """Get a node. If node is a number, load from file.
+        order = range(b, a - 1, -1) if reverse else range(a, b + 1)
+
+        for i in order:
+            # Child i has the keys between keys i - 1 and i
+            if reverse and i < b:
+                yield None, node.item(i)
+
+            if not node.is_leaf and i >= first:
+                yield node.children[i], None
+
+            if not reverse and i < b:
+                yield None, node.item(i)
+
+    @staticmethod
+    def __in_bounds(key, lo, hi):
+        """Return True, if lo < key < hi. None is no bound."""
+        return (lo is None or lo < key) and (hi is None or key < hi)
+
+    @contextmanager
+    def __batch(self):
+        """Hold saved nodes in memory and write each one once, in file order,
+        when the outermost batch ends."""
+        self.__depth += 1
+
+        try:
+            yield
+        finally:
+            self.__depth -= 1
+
+            if self.__depth == 0:
+                self.__commit()
+
+    def __bulk_key(self, levels, h, item, fill):
+        """Add a key to the node being built in level h.
+
+        Each level holds [previous node, separator key, current node], where
+        a node is a tuple (keys, children). The previous node is only written
+        when the current one is full, so the last two can still be balanced.
 
         Keyword arguments:
-            node -- a node
+            levels -- nodes being built in each level
+            h -- level's height (0 for leaves)
+            item -- a (key, value) pair
+            fill -- number of keys per node
         """
-        return node if type(node) is Node else self.__load(node)
+        if h == len(levels):
+            levels.append([None, None, ([], [])])
 
-    def __save(self, node):
-        """Save node in file.
+        prev, sep, (keys, children) = levels[h]
+
+        # Current node still has room
+        if len(keys) < fill:
+            keys.append(item)
+            return
+
+        # Current node is full and item separates it from the next one
+        if prev is not None:
+            self.__bulk_node(levels, h, prev)
+            self.__bulk_key(levels, h + 1, sep, fill)
+
+        levels[h] = [levels[h][2], item, ([], [])]
+
+    def __bulk_node(self, levels, h, node):
+        """Write a node built in level h and link it to level h + 1.
 
         Keyword arguments:
-            node -- a node to be saved
+            levels -- nodes being built in each level
+            h -- node's height
+            node -- a tuple (keys, children)
         """
-        # Get node's attributes
-        values = node.to_list()
+        items, children = node
 
-        # Complete keys and children with -1
-        i = 3 + node.n_keys * 2 # end of keys
+        keys = [k for k, _ in items]
+        values = [v for _, v in items]
 
-        keys = values[3:i]      # get keys
-        children = values[i:]   # get children
+        # Nodes are appended one after another
+        node = self.__layout.node(self.__file.length, keys, values, children)
+        self.__write(node)
 
-        keys += [-1, -1] * (self.max_keys - node.n_keys)           # 2*order keys
-        children += [-1] * (self.max_children - node.n_children)   # 2*order+1 children
+        if h + 1 == len(levels):
+            levels.append([None, None, ([], [])])
 
-        values = values[0:3] + keys + children                      # update values
+        levels[h + 1][2][1].append(node.pos)
 
-        # Write node on-disk
-        n = len(values)
-        [self.__file.write(node.pos + i, [values[i]]) for i in range(n)]
+    def __bulk_close(self, levels, fill):
+        """Write the nodes left in each level and return the top node.
 
-    def __remove(self, node):
-        """Remove a node from file.
-
-        Keyword argument:
-            node -- node to be removed
+        Keyword arguments:
+            levels -- nodes being built in each level
+            fill -- number of keys per node
         """
-        # If node to be removed is the root...
-        if node == self.root:
-            # Erase all data
-            self.__file.truncate(self.__file.length)
-            return
+        h = 0
 
-        # Number of nodes in file - size of one node
-        # The last element in array is (len(array) - 1)
-        last_i = self.__file.length - self.node_len
-
-        # Get last node in file
-        last = self.__load(last_i)
-
-        if self.root.n_keys == 0:
-            self.__get_child(self.root, 0)
-            self.root.children[0].pos = self.root.pos
-            self.root = self.root.children[0]
-        elif last.pos != node.pos:
-            # Need to update position
-            # Find last's father to update position
-            father = self.root
-            key = last.keys[0][0]
-
-            i = father.search(key)
-            child = self.__get_node(father.children[i])
-
-            while child.pos != last.pos:
-                father = child
-                i = father.search(key)
-                child = self.__get_node(father.children[i])
-
-            # Update father's child position and save
-            father.children = [self.__get_node(child) for child in father.children]
-            children_pos = [child.pos for child in father.children]
-            j = children_pos.index(last.pos)
-
-            father.children[j].pos = node.pos
-            self.__save(father)
+        while True:
+            prev, sep, (keys, children) = levels[h]
+
+            # Balance an underflowing last node with its left brother
+            if prev is not None and len(keys) < self.min_keys:
+                keys = prev[0] + [sep] + keys
+                children = prev[1] + children
 
-            # Update last's position and save
-            last.pos = node.pos
-            self.__save(last)
+                if len(keys) <= self.max_keys:
+                    # Both fit in a single node
+                    prev = None
+                else:
+                    # Split evenly
+                    i = len(keys) // 2
+                    prev = (keys[:i], children[:i + 1])
+                    sep = keys[i]
 
-        # Delete last
-        self.__file.truncate(self.node_len)
+                    keys = keys[i + 1:]
+                    children = children[i + 1:]
 
-    def __split(self, father, child):
-        """Split child.
+            if prev is not None:
+                self.__bulk_node(levels, h, prev)
+                self.__bulk_key(levels, h + 1, sep, fill)
+
+            # Nothing above, it is the root
+            if h + 1 == len(levels):
+                return keys, children
+
+            self.__bulk_node(levels, h, (keys, children))
+            h += 1
+
+    def __split(self, path, child):
+        """Split child. A father that overflows is split in turn, going up
+        the path.
 
         Keyword arguments:
-            father -- a node with child in node.children
+            path -- the way down to child, as (ancestor, child's index) pairs
             child -- a node
         """
+        if self.stats is not None:
+            self.stats.count('splits')
+
         # Get split index
-        i = child.n_keys // 2
+        i = self.__layout.split_index(child)
 
         # Get split key,value pair
-        k, v = child.keys[i]
+        k, v = child.item(i)
 
-        # Split keys and children
-        new_keys = child.keys[i + 1:]
-        child_keys = child.keys[:i]
+        # Create a new node with keys and children after split index
+        node = self.__layout.node(self.__allocate(), child.keys[i + 1:], child.values[i + 1:], child.children[i + 1:])
 
-        new_children = child.children[i + 1:]
-        child_children = child.children[:i + 1]
-
-        # Create a new node
-        node = Node(self.__file.length, keys=new_keys, children=new_children)
+        # Keep keys and children before split index in child,
+        # so no node has too many keys when it is written
+        del child.keys[i:]
+        del child.values[i:]
+        del child.children[i + 1:]
 
         # Save new node on-disk
         self.__save(node)
 
         # Check if it is root
-        if father == child:
-            # Create a new father for child
-            father = Node(self.root.pos, keys=[(k,v)], children=[child, node])
-
-            # Set new root as father
-            self.root = father
-
-            # Update child's file position (old root)
-            child.pos = self.__file.length
+        if not path:
+            # Old root keeps its position
             self.__save(child)
+
+            # Create a new father for child and set it as root
+            father = self.__layout.node(self.__allocate(), [k], [v], [child.pos, node.pos])
             self.__save(father)
-        else:
-            # Link the new node with father
-            father.append(k, v, node)
-
-            # If father is full, split father
-            if father.n_keys > self.max_keys:
-
-                # Grandparent starts at root
-                grandpa = self.root
-
-                # If there is a grandfather
-                if father != self.root:
-                    # Find grandfather
-                    i = grandpa.search(k)
-                    node = self.__get_node(grandpa.children[i])
-                    i = node.search(k)
-
-                    # While father not found in grandpa.children
-                    while node != father:
-                        grandpa = node
-                        node = self.__get_node(node.children[i])
-                        i = node.search(k)
-
-                # Split again
-                self.__split(grandpa, father)
-            else:
-                self.__save(father)
+            self.__set_root(father)
+
+            self.__resplit(child, node)
+            return
 
-        # Update child's keys
-        child.keys = child_keys
-        child.children = child_children
+        # Child is saved in this batch, so it is not written early
+        self.__save(child)
+
+        # Link the new node with father
+        father = path[-1][0]
+        father.append(k, v, node.pos)
+
+        # If father is full, split father with the path above it
+        if self.__layout.overflows(father):
+            # Split again
+            self.__split(path[:-1], father)
+        else:
+            self.__save(father)
 
         # Save changes
         self.__save(child)
 
-    def __rotajoin(self, father, leaf, j):
+        self.__resplit(child, node)
+
+    def __resplit(self, *nodes):
+        """Split nodes that still do not fit in a page. Halves of a slotted
+        page may lose their shared prefix, so they take more bytes.
+
+        Keyword arguments:
+            nodes -- nodes just split
+        """
+        for node in nodes:
+            if self.__layout.overflows(node):
+                self.__split(self.__path(node), node)
+
+    def __rotajoin(self, path, leaf):
         """Make a rotation, if possible. Join, otherwise.
 
         Keyword arguments:
-            father -- a parent node
-            leaf -- father's child
-            j -- leaf's index on father
+            path -- the way down to leaf, as (ancestor, child's index) pairs
+            leaf -- an underflowing node
         """
+        father, j = path[-1]
 
-        # Make sure the children are not just numbers
+        # Load brothers, if they exist
         left_brother = Node(-1)
 
         if j > 0:
-            self.__get_child(father, j - 1)
-            left_brother = father.children[j - 1]
+            left_brother = self.__get_node(father.children[j - 1])
 
         right_brother = Node(-1)
 
         if j < father.n_children - 1:
-            self.__get_child(father, j + 1)
-            right_brother = father.children[j + 1]
+            right_brother = self.__get_node(father.children[j + 1])
 
         # If any brother can lose a key
-        if left_brother.n_keys > self.min_keys:
+        if self.__layout.can_lose(left_brother, -1):
             # Rotate right
-            self.__rotate_right(father, leaf, j)
-        elif right_brother.n_keys > self.min_keys:
+            self.__rotate_right(father, leaf, left_brother, j)
+        elif self.__layout.can_lose(right_brother, 0):
             # Rotate left
-            self.__rotate_left(father, leaf, j)
+            self.__rotate_left(father, leaf, right_brother, j)
         # No child is able to lose a key
-        else:
+        elif self.__joinable(father, j):
             # Join nodes
-            self.__join(father, j)
+            self.__join(path, j)
+        # A slotted page is never left empty, its largest brother lends a key anyway
+        elif leaf.n_keys == 0:
+            if left_brother.n_keys > right_brother.n_keys:
+                self.__rotate_right(father, leaf, left_brother, j)
+            else:
+                self.__rotate_left(father, leaf, right_brother, j)
+
+    def __joinable(self, father, i):
+        """Return True, if father's ith child fits in a node with its brother
+        and their key. Fixed records always do, slotted pages may not and
+        are then left as they are.
+
+        Keyword arguments:
+            father -- a parent node
+            i -- child's index
+        """
+        if not self.__layout.variable:
+            return True
+
+        # Same brother and key as in a join
+        ki = i if i == 0 else i - 1
+        j = i + 1 if i == 0 else i - 1
+
+        left, right = sorted([i, j])
+        left = self.__get_node(father.children[left])
+        right = self.__get_node(father.children[right])
+
+        node = self.__layout.node(-1,
+                                  list(left.keys) + [father.keys[ki]] + list(right.keys),
+                                  list(left.values) + [father.values[ki]] + list(right.values),
+                                  list(left.children) + list(right.children))
 
-    def __rotate(self, father, child, ki, ci, fk):
+        return not self.__layout.overflows(node)
+
+    def __rotate(self, father, child, brother, ki, fk):
         """Rotate to left/right.
 
         Keyword arguments:
             father -- a node
             child -- a node in father.children
+            brother -- child's brother that lends a key
             ki -- key's index
-            ci -- child's index
             fk -- father's key index
         """
-        k, v = father.keys[ki]                  # get key
+        if self.stats is not None:
+            self.stats.count('rotations')
+
+        k, v = father.item(ki)                  # get key
         father.remove_key(ki)                   # to delete from father
         child.append_key(k, v)                  # and insert in child
 
-        k, v = father.children[ci].keys[fk]     # get key
-        father.children[ci].remove_key(fk)      # to delete from child
+        k, v = brother.item(fk)                 # get key
+        brother.remove_key(fk)                  # to delete from brother
         father.append_key(k, v)                 # and insert in father
 
         # Update children
-        if not father.children[ci].is_leaf:
+        if not brother.is_leaf:
             if fk == -1:
-                child.children = [father.children[ci].children[fk]] + child.children
+                child.children.insert(0, brother.children[fk])
             else:
-                child.children = child.children + [father.children[ci].children[fk]]
+                child.children.append(brother.children[fk])
 
-            father.children[ci].remove_child(fk)
+            brother.remove_child(fk)
 
         # Save on-disk
-        self.__save(father.children[ci])
+        self.__save(brother)
         self.__save(father)
         self.__save(child)
 
-    def __rotate_right(self, father, child, j):
+        # Keys of other sizes may not fit in slotted pages
+        self.__resplit(father, child)
+
+    def __rotate_right(self, father, child, brother, j):
         """Rotate to right.
 
         Keyword arguments:
             father -- a node
             child -- a node in father.children
+            brother -- child's left brother
             j -- child's index
         """
         ki = j - 1  # key's index
-        ci = j - 1  # child's index
         fk = -1     # father's key index
 
-        self.__rotate(father, child, ki, ci, fk)
+        self.__rotate(father, child, brother, ki, fk)
 
-    def __rotate_left(self, father, child, j):
+    def __rotate_left(self, father, child, brother, j):
         """Rotate to left.
 
         Keyword arguments:
             father -- a node
             child -- a node in father.children
+            brother -- child's right brother
             j -- child's index
         """
         ki = j      # key's index
-        ci = j + 1  # child's index
         fk = 0      # father's key index
 
-        self.__rotate(father, child, ki, ci, fk)
+        self.__rotate(father, child, brother, ki, fk)
 
-    def __join(self, node, i):
-        """Join leafs.
+    def __join(self, path, i):
+        """Join leafs. A father that underflows is rotated or joined in
+        turn, going up the path.
 
         Keyword argument:
-            node -- father of nodes to be joined
+            path -- the way down to the father of nodes to be joined
             i -- child's position
         """
+        node = path[-1][0]
+
+        if self.stats is not None:
+            self.stats.count('joins')
+
         # Left/right brother to merge
         ki = i if i == 0 else i - 1
         j = i + 1 if i == 0 else i - 1
 
-        # Make sure nodes are loaded
-        self.__get_child(node, i)
-        self.__get_child(node, j)
+        # Load nodes
+        right = self.__get_node(node.children[i])
+        left = self.__get_node(node.children[j])
 
-        k, v = node.keys[ki]                   # get key
+        k, v = node.item(ki)                   # get key
         node.remove_key(ki)                    # to remove from father
-        node.children[i].append_key(k, v)     # and append on left child
-
-        # Merge left child's keys to right/left's child keys in the left
-        right = node.children[i]
-        left = node.children[j]
-
-        node.children[i].keys = list(left.keys) + list(right.keys)
+        right.append_key(k, v)                 # and append on child
 
+        # Merge brother's keys and children into child
         if j == i + 1:
-            node.children[i].children = list(right.children) + list(left.children)
+            right.keys.extend(left.keys)
+            right.values.extend(left.values)
+            right.children.extend(left.children)
         else:
-            node.children[i].children = list(left.children) + list(right.children)
+            right.keys = left.keys + right.keys
+            right.values = left.values + right.values
+            right.children = left.children + right.children
 
-        self.__save(node.children[i])
+        self.__save(right)
 
         # Remove right child
         node.remove_child(j)
@@ -721,33 +2240,17 @@ class BTree():
         # Save changes on-disk
         self.__save(node)
 
-        # Save removal on-disk
-        self.__remove(left)
+        # Free brother's slot
+        self.__free(left.pos)
 
-        if node.n_keys < self.min_keys:
+        if self.__layout.underflows(node):
 
             # If node is root...
             if node.pos == self.root.pos:
                 if node.n_keys == 0:
-                    # Remove a level from tree
-                    self.__remove(right)
-                    right.pos = self.root.pos
-
-                    self.root = right
-                    self.__save(self.root)
+                    # Remove a level from tree, child becomes the root
+                    self.__set_root(right)
+                    self.__free(node.pos)
             else:
-                # Find node's parent
-                father = self.root                          # start from root
-                key = node.keys[0][0]
-                j = father.search(key)
-                child = self.__get_node(father.children[j])
-                i = search(child.keys, key, lambda x: x[0])  # node.key's index
-
-                while i is None and not child.is_leaf:
-                    father = child
-                    j = father.search(key)
-                    child = self.__get_node(father.children[j])
-                    i = search(child.keys, key, lambda x: x[0])
-
-                # Rotate or join... again
-                self.__rotajoin(father, child, j)
+                # Rotate or join... again, node's father is next in path
+                self.__rotajoin(path[:-1], node)
@@ -0,0 +1,120 @@
+from bisect import bisect_right
+from random import Random
+from .layout import Layout
+from .storage import NodeFile
+
+
+def spread(n, fill, max_keys):
+    """Return the number of keys in each node, when n sorted keys are
+    packed in nodes of about fill keys and the key between two nodes goes
+    up a level. Nodes get at least max_keys // 2 keys, if there are many.
+
+    Keyword arguments:
+        n -- number of keys
+        fill -- wanted number of keys per node
+        max_keys -- maximum number of keys per node
+    """
+    if n <= max_keys:
+        return [n]
+
+    # Each node takes its keys and the one after it
+    count = max(1, (n + 1) // (fill + 1))
+
+    if -(-(n + 1 - count) // count) > max_keys:
+        count += 1
+
+    # Keys left in nodes are shared evenly
+    q, r = divmod(n + 1 - count, count)
+    return [q + 1] * r + [q] * (count - r)
+
+
+def partition(items, n, max_keys, seed=0):
+    """Split (key, value) pairs in at most n lists by key range, so each
+    list's keys are all smaller than the next list's. Ranges are chosen
+    from a sample of the keys, lists too small to fill a node are joined
+    to their neighbour.
+
+    Keyword arguments:
+        items -- a list of (key, value)
+        n -- maximum number of lists
+        max_keys -- maximum number of keys per node
+        seed -- sample's random seed (default 0)
+    """
+    sample = Random(seed).sample(items, min(len(items), 1000 * n))
+    keys = sorted(key for key, _ in sample)
+
+    # Keys that split the sample in n equal parts
+    splitters = [keys[len(keys) * i // n] for i in range(1, n)]
+    parts = [[] for _ in range(n)]
+
+    # Equal keys always go to the same part
+    for item in items:
+        parts[bisect_right(splitters, item[0])].append(item)
+
+    joined = []
+
+    for part in parts:
+        if joined and (len(joined[-1]) <= max_keys or len(part) <= max_keys):
+            joined[-1].extend(part)
+        else:
+            joined.append(part)
+
+    return joined
+
+
+def write_leaves(filepath, key_format, value_format, max_keys, max_children, items, head, pos, sizes):
+    """Sort a part of the pairs and write it as a run of leaves, one after
+    another, starting at pos. Runs in a worker process.
+
+    Return (head's pair, the pairs between leaves). The head pair goes
+    between the previous part's last leaf and this part's first one (None,
+    if it is the first part).
+
+    Keyword arguments:
+        filepath -- tree's file
+        key_format -- keys' struct format
+        value_format -- values' struct format
+        max_keys -- number of key slots in a node
+        max_children -- number of child slots in a node
+        items -- a list of (key, value) pairs, in any order
+        head -- if True, the smallest pair is the head's
+        pos -- first leaf's position
+        sizes -- number of keys in each leaf
+    """
+    layout = Layout(key_format, value_format, max_keys, max_children)
+    items.sort(key=lambda x: x[0])
+
+    # Keys should be unique and fit in a record
+    for i, (key, value) in enumerate(items):
+        if i > 0 and key <= items[i - 1][0]:
+            raise ValueError('Keys should be unique.')
+
+        layout.check(key, value)
+
+    first = items[0] if head else None
+    i = 1 if head else 0
+
+    separators = []
+    out = NodeFile(filepath, 'i')
+    run = []        # packed leaves not written yet
+
+    for j, size in enumerate(sizes):
+        keys = [key for key, _ in items[i:i + size]]
+        values = [value for _, value in items[i:i + size]]
+        i += size
+
+        run.append(layout.pack(layout.node(pos + j * layout.node_len, keys, values, [])))
+
+        # Key between this leaf and the next goes up
+        if j + 1 < len(sizes):
+            separators.append(items[i])
+            i += 1
+
+        # Leaves are written in big sequential blocks
+        if len(run) == 256 or j + 1 == len(sizes):
+            start = pos + (j + 1 - len(run)) * layout.node_len
+            out.write(start, b''.join(run))
+            run = []
+
+    out.close()
+    return first, separators
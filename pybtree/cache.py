@@ -0,0 +1,111 @@
+from threading import Lock
+from collections import OrderedDict
+
+
+class NodeCache():
+    """Represent a bounded LRU cache of nodes keyed by file position.
+
+    Dirty nodes are written back only when they are evicted or flushed.
+    Each call is atomic, so threads reading a tree can share its cache.
+
+    Properties:
+        capacity -- maximum number of nodes in cache
+        hits -- number of lookups answered by the cache
+        misses -- number of lookups that were not in cache
+        n_dirty -- number of nodes waiting to be written
+    """
+
+    def __init__(self, capacity, write):
+        """Create an empty cache.
+
+        Keyword arguments:
+            capacity -- maximum number of nodes in cache
+            write -- function that writes a node to disk
+        """
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+
+        self.__write = write
+        self.__nodes = OrderedDict()  # pos => node, least recently used first
+        self.__dirty = set()          # positions of dirty nodes
+        self.__lock = Lock()
+
+    @property
+    def n_dirty(self):
+        return len(self.__dirty)
+
+    def get(self, pos):
+        """Return the node in pos, if cached. None, otherwise.
+
+        Keyword arguments:
+            pos -- node's position in file
+        """
+        with self.__lock:
+            node = self.__nodes.get(pos)
+
+            # A node moved to other position is not valid anymore
+            if node is None or node.pos != pos:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.__nodes.move_to_end(pos)
+
+            return node
+
+    def put(self, node, dirty=False):
+        """Cache a node, evicting the least recently used if full.
+
+        Keyword arguments:
+            node -- node to be cached
+            dirty -- if True, node must be written before leaving the cache
+        """
+        with self.__lock:
+            self.__nodes[node.pos] = node
+            self.__nodes.move_to_end(node.pos)
+
+            if dirty:
+                self.__dirty.add(node.pos)
+            else:
+                self.__dirty.discard(node.pos)
+
+            # Evict least recently used nodes
+            while len(self.__nodes) > self.capacity:
+                pos, old = self.__nodes.popitem(last=False)
+
+                if pos in self.__dirty:
+                    self.__dirty.remove(pos)
+                    self.__write(old)
+
+    def discard(self, pos):
+        """Drop a node from cache without writing it.
+
+        Keyword arguments:
+            pos -- node's position in file
+        """
+        with self.__lock:
+            self.__nodes.pop(pos, None)
+            self.__dirty.discard(pos)
+
+    def flush(self):
+        """Write all dirty nodes, in file order."""
+        with self.__lock:
+            for pos in sorted(self.__dirty):
+                self.__write(self.__nodes[pos])
+
+            self.__dirty.clear()
+
+    def clear(self):
+        """Drop all nodes without writing them."""
+        with self.__lock:
+            self.__nodes.clear()
+            self.__dirty.clear()
+
+    def __len__(self):
+        """Return the number of cached nodes."""
+        return len(self.__nodes)
+
+    def __contains__(self, pos):
+        """Return True, if node in pos is cached."""
+        return pos in self.__nodes
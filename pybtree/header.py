@@ -0,0 +1,171 @@
+from .layout import VARIABLE
+
+
+# File header: magic, version, order, root's position, free list's head,
+# number of free nodes, key's and value's formats, slotted page's size, tree's
+# kind, generation and reserved cells.
+# Nodes start right after it.
+MAGIC = -0x62747265     # never a valid order, so headerless files are told apart
+VERSION = 3             # version 3 adds slotted pages
+HEADER_LEN = 16
+
+# Header cells' indexes
+H_ORDER = 2
+H_ROOT = 3
+H_FREE = 4
+H_N_FREE = 5
+H_KEY_CODE = 6          # a format is saved as its code's ord and count, e.g. '16s' is (115, 16)
+H_KEY_COUNT = 7
+H_VALUE_CODE = 8
+H_VALUE_COUNT = 9
+H_PAGE_SIZE = 10        # slotted page's size in bytes (0, if nodes have fixed records)
+H_KIND = 11             # tree's kind, BTREE or BPLUSTREE
+H_GENERATION = 12       # changed by every write shown to other processes
+
+# Trees' kinds
+BTREE = 0
+BPLUSTREE = 1
+
+
+def new_header(kind, order, key_format, value_format, page_size=0):
+    """Return the header of a file with no free slot.
+
+    Keyword arguments:
+        kind -- tree's kind, BTREE or BPLUSTREE
+        order -- tree's order
+        key_format -- keys' format
+        value_format -- values' format
+        page_size -- slotted page's size in bytes, 0 for fixed records (default 0)
+    """
+    header = [MAGIC, VERSION, order, HEADER_LEN, 0, 0] + [0] * (HEADER_LEN - 6)
+    header[H_KIND] = kind
+    header[H_PAGE_SIZE] = page_size
+
+    # Format's code and count, variable-length formats are 1 ('bytes') and 2 ('str')
+    for i, fmt in ((H_KEY_CODE, key_format), (H_VALUE_CODE, value_format)):
+        if fmt in VARIABLE:
+            header[i] = VARIABLE.index(fmt) + 1
+        else:
+            header[i] = ord(fmt[-1])
+            header[i + 1] = int(fmt[:-1] or 1)
+
+    return header
+
+
+def header_format(header, i):
+    """Return the format saved in the ith header's cell. Files before
+    version 2 have int keys and values.
+
+    Keyword arguments:
+        header -- a header's cells
+        i -- index of format's code
+    """
+    code, count = header[i:i + 2]
+
+    if code == 0:
+        return 'i'
+
+    if code <= len(VARIABLE):
+        return VARIABLE[code - 1]
+
+    code = chr(code)
+    return '{}s'.format(count) if code == 's' else code
+
+
+def read_header(storage, read):
+    """Read header from file.
+
+    Keyword arguments:
+        storage -- the tree's storage
+        read -- function that reads n cells from the ith on
+    """
+    return list(storage.block(HEADER_LEN).unpack(read(0, HEADER_LEN)))
+
+
+def write_header(storage, header, write):
+    """Write header in file.
+
+    Keyword arguments:
+        storage -- the tree's storage
+        header -- a header's cells
+        write -- function that writes bytes from the ith cell on
+    """
+    write(0, storage.block(HEADER_LEN).pack(*header))
+
+
+def trim(storage, node_len, read):
+    """Truncate spare cells left after the last node by an unclean close.
+
+    Keyword arguments:
+        storage -- the tree's storage
+        node_len -- number of cells per node
+        read -- function that reads n cells from the ith on
+    """
+    # Nodes are appended whole, right after the header
+    storage.truncate((storage.length - HEADER_LEN) % node_len)
+
+    # Spare cells are all zero, a node never is (its position is not zero)
+    while storage.length > HEADER_LEN:
+        record = read(storage.length - node_len, node_len)
+
+        if any(record):
+            break
+
+        storage.truncate(node_len)
+
+
+def allocate(storage, header, read, write):
+    """Return a position for a new node.
+
+    A free slot is taken from the free list, if any. Otherwise, the node
+    goes to the end of file and should be saved before the next allocation.
+
+    Keyword arguments:
+        storage -- the tree's storage
+        header -- a header's cells, changed and written
+        read -- function that reads n cells from the ith on
+        write -- function that writes bytes from the ith cell on
+    """
+    pos = header[H_FREE]
+
+    if pos == 0:
+        return storage.length
+
+    # A free slot holds its position, -1 and the next free slot
+    _, _, nxt = storage.block(3).unpack(read(pos, 3))
+
+    header[H_FREE] = nxt
+    header[H_N_FREE] -= 1
+    write_header(storage, header, write)
+
+    return pos
+
+
+def free(storage, header, pos, write):
+    """Put a slot in the free list.
+
+    Keyword arguments:
+        storage -- the tree's storage
+        header -- a header's cells, changed and written
+        pos -- slot's position
+        write -- function that writes bytes from the ith cell on
+    """
+    # Link slot to the current head
+    write(pos, storage.block(3).pack(pos, -1, header[H_FREE]))
+
+    header[H_FREE] = pos
+    header[H_N_FREE] += 1
+    write_header(storage, header, write)
+
+
+def set_root(storage, header, pos, write):
+    """Save the root's position in header.
+
+    Keyword arguments:
+        storage -- the tree's storage
+        header -- a header's cells, changed and written
+        pos -- root's position
+        write -- function that writes bytes from the ith cell on
+    """
+    header[H_ROOT] = pos
+    write_header(storage, header, write)
@@ -0,0 +1,888 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from struct import Struct, error
+from collections import namedtuple
+
+
+# Formats for keys and values: ints and floats, fixed-size bytes ('<size>s')
+# and, in slotted pages only, variable-length bytes and strings
+CODES = 'bBhHiIlLqQfd'
+VARIABLE = ('bytes', 'str')
+
+# Formats kept in arrays
+ARRAYS = CODES
+
+# A value spilled to a chain of overflow pages
+Overflow = namedtuple('Overflow', ['pos', 'length'])
+
+
+def rounder(key_format):
+    """Return a function that returns a key as it is saved in key_format,
+    so it compares equal to the key read back. None, if keys are saved as
+    they are. Only floats of format 'f' are rounded, to single precision.
+
+    Keyword arguments:
+        key_format -- keys' format
+    """
+    if key_format != 'f':
+        return None
+
+    single = Struct('=f')
+
+    def round_key(key):
+        try:
+            return single.unpack(single.pack(key))[0]
+        except (error, TypeError):
+            # Key cannot be saved, so check rejects it and no key equals it
+            return key
+
+    return round_key
+
+
+class Node():
+    """Represent a Node in BTree.
+
+    Keys, values and children's positions are kept in parallel arrays.
+    Keys and values are lists, if their type has no array (e.g. bytes).
+
+    Properties:
+        pos -- node's position in file
+        keys -- an array of keys, in order
+        values -- an array of values, values[i] is keys[i]'s value
+        children -- an array of children's positions
+        is_leaf -- If node is a leaf, True. Otherwise, False
+        n_keys -- number of keys in node
+        n_children -- number of children in node
+    """
+    __slots__ = ('pos', 'keys', 'values', 'children')
+
+    # Keys' and values' array type codes (None for lists)
+    key_type = 'i'
+    value_type = 'i'
+
+    def __init__(self, pos, keys=(), values=(), children=()):
+        """Create a new Node representation.
+
+        Keyword arguments:
+            pos -- node's position in file
+            keys -- node's keys, in order (default empty)
+            values -- keys' values (default empty)
+            children -- children's positions (default empty)
+        """
+        self.pos = pos
+        self.keys = array(self.key_type, keys) if self.key_type else list(keys)
+        self.values = array(self.value_type, values) if self.value_type else list(values)
+        self.children = array('i', children)
+
+    @property
+    def is_leaf(self):
+        """Return True, if node is a leaf, i.e., has no child."""
+        return len(self.children) == 0
+
+    @property
+    def n_keys(self):
+        """Return the number of keys in node."""
+        return len(self.keys)
+
+    @property
+    def n_children(self):
+        """Return the number of children in node."""
+        return len(self.children)
+
+    def item(self, i):
+        """Return the ith (key, value) pair.
+
+        Keyword arguments:
+            i -- key's index
+        """
+        return self.keys[i], self.values[i]
+
+    def items(self):
+        """Return a list of (key, value) pairs, ordered by key."""
+        return list(zip(self.keys, self.values))
+
+    def search(self, key):
+        """Search for a node with key.
+
+        Return a child index.
+
+        Keyword arguments:
+            key -- key to be search in node
+        """
+        # If node is leaf, there is no other path
+        if self.is_leaf:
+            return None
+
+        # Left of the first key greater than key
+        return bisect_right(self.keys, key)
+
+    def find(self, key):
+        """Search for key in node.
+
+        Return key's index. None, if key is not in node.
+
+        Keyword arguments:
+            key -- key to be found
+        """
+        i = bisect_left(self.keys, key)
+
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+
+        return None
+
+    def append_key(self, key, value):
+        """Append a key to node, keeping keys in order.
+
+        Return key's index.
+
+        Keyword arguments:
+            key -- key to be appended
+            value -- key's value
+        """
+        i = bisect_right(self.keys, key)
+
+        self.keys.insert(i, key)
+        self.values.insert(i, value)
+
+        return i
+
+    def set_key(self, i, key, value):
+        """Replace the ith key, keeping keys in order.
+
+        Keyword arguments:
+            i -- key's index
+            key -- new key
+            value -- new key's value
+        """
+        self.keys[i] = key
+        self.values[i] = value
+
+    def append(self, key, value, child):
+        """Append a key,value with right child.
+
+        Keyword arguments:
+            key -- key to be appended
+            value -- key's value
+            child -- child's position
+        """
+        # Append key,value pair and find its position in keys list
+        i = self.append_key(key, value)
+
+        # Append child right after key
+        self.children.insert(i + 1, child)
+
+    def remove_key(self, i):
+        """Remove the ith key.
+
+        Keyword argument:
+            i -- key's index
+        """
+        del self.keys[i]
+        del self.values[i]
+
+    def remove_child(self, i):
+        """Remove the ith child.
+
+        Keyword argument:
+            i -- child's index
+        """
+        del self.children[i]
+
+    @classmethod
+    def typed(cls, key_format, value_format):
+        """Return a Node class for keys and values of the given formats.
+
+        Keyword arguments:
+            key_format -- keys' format
+            value_format -- values' format
+        """
+        key_type = key_format if key_format in ARRAYS else None
+        value_type = value_format if value_format in ARRAYS else None
+
+        if (key_type, value_type) == (cls.key_type, cls.value_type):
+            return cls
+
+        return type(cls.__name__, (cls,), {'__slots__': (),
+                                           'key_type': key_type,
+                                           'value_type': value_type})
+
+    def __eq__(self, other):
+        """Equal comparison between nodes."""
+        return self.pos == other.pos
+
+
+class Layout():
+    """Represent a node's on-disk record.
+
+    A record is the node's position, # of keys, # of children, max_keys
+    (key, value) pairs and max_children children's positions. Empty slots
+    are zero. The record takes a whole number of cells of the file.
+
+    Properties:
+        key_format -- keys' struct format
+        value_format -- values' struct format
+        node -- the Node class for keys and values of these formats
+        round_key -- function that rounds a key as it is saved (None, if keys are not rounded)
+        node_len -- number of cells in a record
+        variable -- False, the number of keys in a node is fixed by order
+    """
+    variable = False
+
+    def __init__(self, key_format, value_format, max_keys, max_children, cell=4):
+        """Create a record layout.
+
+        Keyword arguments:
+            key_format -- keys' struct format (e.g. 'i', 'q' or '16s')
+            value_format -- values' struct format
+            max_keys -- number of key slots in record
+            max_children -- number of child slots in record
+            cell -- file cell's size in bytes (default 4)
+        """
+        self.key_format = self.parse(key_format)
+        self.value_format = self.parse(value_format)
+        self.node = Node.typed(self.key_format, self.value_format)
+        self.round_key = rounder(self.key_format)
+
+        self.__max_keys = max_keys
+        self.__min_keys = max_keys // 2
+        self.__max_children = max_children
+        self.__start = 3 + max_keys * 2     # first child's index
+
+        # Sizes are standard and there is no padding between fields
+        pair = self.key_format + self.value_format
+        self.__struct = Struct('=3i' + pair * max_keys + '{}i'.format(max_children))
+        self.__item = Struct('=' + pair)
+        self.__key_size = Struct('=' + self.key_format).size
+        self.__value_size = Struct('=' + self.value_format).size
+
+        # Round up to whole cells
+        self.__cell = cell
+        self.node_len = -(-self.__struct.size // cell)
+        self.__spare = bytes(self.node_len * cell - self.__struct.size)
+
+        # Empty slots and trailing NUL bytes
+        self.__key_pad = b'' if self.node.key_type is None else 0
+        self.__value_pad = b'' if self.node.value_type is None else 0
+
+    @staticmethod
+    def parse(fmt):
+        """Return a normalized format. Raise ValueError, if it is not
+        an int, float or bytes format.
+
+        Keyword arguments:
+            fmt -- a struct format (e.g. 'q' or '16s')
+        """
+        code = fmt[-1:]
+        count = fmt[:-1]
+
+        if code not in CODES + 's' or (count and (code != 's' or not count.isdigit() or int(count) < 1)):
+            raise ValueError('Invalid format {}. Use one of {} or \'<size>s\'.'.format(repr(fmt),
+                                                                                     ', '.join(CODES)))
+
+        if code == 's' and not count:
+            fmt = '1s'
+
+        return fmt
+
+    def check(self, key, value):
+        """Raise ValueError, if key or value cannot be saved in a record.
+
+        Keyword arguments:
+            key -- a key
+            value -- key's value
+        """
+        try:
+            self.__item.pack(key, value)
+        except error as e:
+            raise ValueError('Key {} or value {} does not fit in {}: {}.'.format(repr(key), repr(value),
+                                                                                repr(self.__item.format), e))
+
+        # Bytes are cut silently
+        if self.node.key_type is None and len(key) > self.__key_size:
+            raise ValueError('Key {} is longer than {}.'.format(repr(key), repr(self.key_format)))
+
+        if self.node.value_type is None and len(value) > self.__value_size:
+            raise ValueError('Value {} is longer than {}.'.format(repr(value), repr(self.value_format)))
+
+        # Padding is stripped when read, so trailing NUL bytes would be lost
+        if self.node.key_type is None and key.endswith(b'\0'):
+            raise ValueError('Key {} ends with a NUL byte.'.format(repr(key)))
+
+        if self.node.value_type is None and value.endswith(b'\0'):
+            raise ValueError('Value {} ends with a NUL byte.'.format(repr(value)))
+
+    def inline(self, value):
+        """Return True, if value is saved in node. Always, for fixed records.
+
+        Keyword arguments:
+            value -- a value
+        """
+        return True
+
+    def overflows(self, node):
+        """Return True, if node has too many keys.
+
+        Keyword arguments:
+            node -- a Node
+        """
+        return len(node.keys) > self.__max_keys
+
+    def underflows(self, node):
+        """Return True, if node has too few keys.
+
+        Keyword arguments:
+            node -- a Node
+        """
+        return len(node.keys) < self.__min_keys
+
+    def can_lose(self, node, i=None):
+        """Return True, if node can lose a key without underflowing.
+
+        Keyword arguments:
+            node -- a Node
+            i -- index of the key to be lost (default None, the first or last)
+        """
+        return len(node.keys) > self.__min_keys
+
+    def split_index(self, node):
+        """Return the index of the key that goes up when node is split.
+
+        Keyword arguments:
+            node -- an overflowing Node
+        """
+        return len(node.keys) // 2
+
+    def pack(self, node):
+        """Return node's record.
+
+        Keyword arguments:
+            node -- a Node
+        """
+        n_keys = len(node.keys)
+        n_children = len(node.children)
+
+        values = [self.__key_pad, self.__value_pad] * self.__max_keys
+        values[0:0] = node.pos, n_keys, n_children
+        values[3:3 + n_keys * 2:2] = node.keys
+        values[4:4 + n_keys * 2:2] = node.values
+        values.extend(node.children)
+        values.extend([0] * (self.__max_children - n_children))
+
+        return self.__struct.pack(*values) + self.__spare
+
+    def pack_value(self, node, i):
+        """Return (first cell, bytes) of the whole cells that hold node's ith
+        value in its record, so a new value is written alone.
+
+        Keyword arguments:
+            node -- a Node
+            i -- value's index
+        """
+        # Value follows its key
+        start = 12 + i * self.__item.size + self.__key_size
+        end = start + self.__value_size
+
+        first = start // self.__cell
+        last = -(-end // self.__cell)
+
+        return first, self.pack(node)[first * self.__cell:last * self.__cell]
+
+    def unpack(self, data):
+        """Return the Node in a record.
+
+        Keyword arguments:
+            data -- node's record
+        """
+        values = self.__struct.unpack_from(data)
+
+        pos, n_keys, n_children = values[0:3]
+        start = self.__start
+
+        # Keys and values are interleaved
+        keys = values[3:3 + n_keys * 2:2]
+        vals = values[4:4 + n_keys * 2:2]
+        children = values[start:start + n_children]
+
+        # Bytes are padded with NUL
+        if self.node.key_type is None:
+            keys = [k.rstrip(b'\0') for k in keys]
+
+        if self.node.value_type is None:
+            vals = [v.rstrip(b'\0') for v in vals]
+
+        # Return a Node object
+        return self.node(pos, keys, vals, children)
+
+
+class SlottedLayout():
+    """Represent a node as a slotted page of variable-length keys and values.
+
+    A page is the node's position, # of keys, # of children, the length of
+    the prefix shared by all keys, the prefix, children's positions, a slot
+    with each entry's offset and the entries. An entry is the key without
+    the prefix and its value, or the position of the first overflow page
+    holding a long value. Fan-out depends on how many bytes fit in a page.
+
+    Properties:
+        key_format -- keys' format
+        value_format -- values' format
+        node -- the Node class for keys and values of these formats
+        round_key -- function that rounds a key as it is saved (None, if keys are not rounded)
+        node_len -- number of cells in a page
+        page_size -- page's size in bytes
+        max_key -- maximum key's size in bytes
+        max_inline -- maximum size in bytes of a value saved in page
+        variable -- True, the number of keys in a node depends on their sizes
+    """
+    variable = True
+
+    head = Struct('=3iH')      # position, # of keys, # of children, prefix's length
+    entry = Struct('=HI')      # suffix's length, value's length (or overflow flag + length)
+    ref = Struct('=i')         # first overflow page's position
+    flag = 1 << 31             # value is in overflow pages
+
+    def __init__(self, key_format, value_format, page_size=4096, cell=4):
+        """Create a page layout.
+
+        Keyword arguments:
+            key_format -- keys' format: 'bytes', 'str' or a struct format
+            value_format -- values' format, same options as keys
+            page_size -- page's size in bytes (default 4096)
+            cell -- file cell's size in bytes (default 4)
+        """
+        if not 256 <= page_size <= 1 << 16 or page_size % cell:
+            raise ValueError('Page size should be a multiple of {} in [256, 65536].'.format(cell))
+
+        self.key_format, self.__encode_key, self.__decode_key = self.codec(key_format)
+        self.value_format, self.__encode_value, self.__decode_value = self.codec(value_format)
+        self.node = Node.typed(self.key_format, self.value_format)
+        self.round_key = rounder(self.key_format)
+
+        self.page_size = page_size
+        self.node_len = page_size // cell
+
+        # Every entry fits in an eighth of page, so any split fits in two pages
+        self.max_key = page_size // 8
+        self.max_inline = page_size // 8
+
+        # Nodes with less than a quarter of page used underflow
+        self.__min_used = page_size // 4
+
+    @staticmethod
+    def codec(fmt):
+        """Return (format, encode, decode) for a format.
+
+        Keyword arguments:
+            fmt -- 'bytes', 'str' or a struct format
+        """
+        if fmt == 'bytes':
+            return fmt, bytes, bytes
+
+        if fmt == 'str':
+            return fmt, str.encode, bytes.decode
+
+        fmt = Layout.parse(fmt)
+        strct = Struct('=' + fmt)
+
+        if fmt.endswith('s'):
+            def encode(data):
+                # Bytes would be cut silently
+                if len(data) > strct.size:
+                    raise error('longer than {}'.format(repr(fmt)))
+
+                # Padding is stripped when read, so trailing NUL bytes would be lost
+                if data.endswith(b'\0'):
+                    raise error('ends with a NUL byte')
+
+                return strct.pack(data)
+
+            return fmt, encode, lambda data: strct.unpack(data)[0].rstrip(b'\0')
+
+        return fmt, strct.pack, lambda data: strct.unpack(data)[0]
+
+    def check(self, key, value):
+        """Raise ValueError, if key is too long or key/value cannot be encoded.
+
+        Keyword arguments:
+            key -- a key
+            value -- key's value
+        """
+        try:
+            key_data = self.__encode_key(key)
+            self.__encode_value(value)
+        except (TypeError, AttributeError, error) as e:
+            raise ValueError('Key {} or value {} does not fit in {}/{}: {}.'.format(repr(key), repr(value),
+                                                                                 repr(self.key_format),
+                                                                                 repr(self.value_format), e))
+
+        if len(key_data) > self.max_key:
+            raise ValueError('Key {} is longer than {} bytes.'.format(repr(key), self.max_key))
+
+    def inline(self, value):
+        """Return True, if value is short enough to be saved in page.
+
+        Keyword arguments:
+            value -- a value
+        """
+        return len(self.__encode_value(value)) <= self.max_inline
+
+    def encode_value(self, value):
+        """Return value's bytes.
+
+        Keyword arguments:
+            value -- a value
+        """
+        return self.__encode_value(value)
+
+    def decode_value(self, data):
+        """Return the value in data.
+
+        Keyword arguments:
+            data -- value's bytes
+        """
+        return self.__decode_value(data)
+
+    def used(self, node):
+        """Return the number of bytes node takes in a page.
+
+        Keyword arguments:
+            node -- a Node
+        """
+        keys = [self.__encode_key(k) for k in node.keys]
+        p = len(self.prefix(keys))
+
+        size = self.head.size + p + 4 * len(node.children)
+
+        for k, v in zip(keys, node.values):
+            size += self.__entry_size(len(k) - p, v)
+
+        return size
+
+    def overflows(self, node):
+        """Return True, if node does not fit in a page.
+
+        Keyword arguments:
+            node -- a Node
+        """
+        return self.used(node) > self.page_size
+
+    def underflows(self, node):
+        """Return True, if node uses less than a quarter of page.
+
+        Keyword arguments:
+            node -- a Node
+        """
+        return self.used(node) < self.__min_used
+
+    def can_lose(self, node, i=None):
+        """Return True, if node can lose a key without underflowing.
+
+        Keyword arguments:
+            node -- a Node
+            i -- index of the key to be lost (default None, the first or last)
+        """
+        if not node.keys:
+            return False
+
+        edges = [0, -1] if i is None else [i]
+        lost = max(self.__entry_size(len(self.__encode_key(node.keys[j])), node.values[j]) for j in edges)
+
+        # A child may go with the key
+        if node.children:
+            lost += 4
+
+        return self.used(node) - lost >= self.__min_used
+
+    def split_index(self, node):
+        """Return the index of the key that goes up when node is split,
+        so both halves use about the same number of bytes.
+
+        Keyword arguments:
+            node -- an overflowing Node
+        """
+        sizes = [self.__entry_size(len(self.__encode_key(k)), v) for k, v in zip(node.keys, node.values)]
+        half = sum(sizes) // 2
+        used = 0
+
+        for i, size in enumerate(sizes):
+            used += size
+
+            if used > half:
+                return max(1, min(i, len(sizes) - 2))
+
+        return len(sizes) // 2
+
+    @staticmethod
+    def prefix(keys):
+        """Return the prefix shared by all sorted keys' bytes.
+
+        Keyword arguments:
+            keys -- keys' bytes, in order
+        """
+        if not keys:
+            return b''
+
+        # First and last keys are the most different ones
+        first, last = keys[0], keys[-1]
+        n = min(len(first), len(last))
+        i = 0
+
+        while i < n and first[i] == last[i]:
+            i += 1
+
+        return first[:i]
+
+    def pack(self, node):
+        """Return node's page.
+
+        Keyword arguments:
+            node -- a Node
+        """
+        keys = [self.__encode_key(k) for k in node.keys]
+        prefix = self.prefix(keys)
+        p = len(prefix)
+
+        n_keys = len(keys)
+        n_children = len(node.children)
+
+        head = (self.head.pack(node.pos, n_keys, n_children, p) + prefix +
+                Struct('={}i'.format(n_children)).pack(*node.children))
+
+        # Entries start after the slots
+        offset = len(head) + 2 * n_keys
+        offsets = []
+        entries = []
+
+        for k, v in zip(keys, node.values):
+            if type(v) is Overflow:
+                entry = self.entry.pack(len(k) - p, self.flag | v.length) + k[p:] + self.ref.pack(v.pos)
+            else:
+                v = self.__encode_value(v)
+                entry = self.entry.pack(len(k) - p, len(v)) + k[p:] + v
+
+            offsets.append(offset)
+            entries.append(entry)
+            offset += len(entry)
+
+        if offset > self.page_size:
+            raise ValueError('Node with {} bytes does not fit in a page.'.format(offset))
+
+        slots = Struct('={}H'.format(n_keys)).pack(*offsets)
+
+        return head + slots + b''.join(entries) + bytes(self.page_size - offset)
+
+    def unpack(self, data):
+        """Return the Node in a page.
+
+        Keyword arguments:
+            data -- node's page
+        """
+        pos, n_keys, n_children, p = self.head.unpack_from(data)
+        offset = self.head.size
+
+        prefix = data[offset:offset + p]
+        offset += p
+
+        children = Struct('={}i'.format(n_children)).unpack_from(data, offset)
+        offset += 4 * n_children
+
+        slots = Struct('={}H'.format(n_keys)).unpack_from(data, offset)
+
+        keys = []
+        values = []
+
+        for offset in slots:
+            k, v = self.entry.unpack_from(data, offset)
+            offset += self.entry.size
+
+            keys.append(self.__decode_key(prefix + data[offset:offset + k]))
+            offset += k
+
+            if v & self.flag:
+                values.append(Overflow(self.ref.unpack_from(data, offset)[0], v & ~self.flag))
+            else:
+                values.append(self.__decode_value(data[offset:offset + v]))
+
+        # Return a Node object
+        return self.node(pos, keys, values, children)
+
+    def __entry_size(self, suffix, value):
+        """Return the bytes taken by an entry and its slot.
+
+        Keyword arguments:
+            suffix -- key's size without prefix
+            value -- key's value
+        """
+        if type(value) is Overflow:
+            return 2 + self.entry.size + suffix + self.ref.size
+
+        return 2 + self.entry.size + suffix + len(self.__encode_value(value))
+
+
+class PlusNode(Node):
+    """Represent a Node in a B+ tree.
+
+    Inner nodes only have keys and children. Leaves have keys, values and
+    their neighbours' positions, so they can be read one after another.
+
+    Properties:
+        prev -- previous leaf's position (0, if there is none)
+        next -- next leaf's position (0, if there is none)
+    """
+    __slots__ = ('prev', 'next')
+
+    def __init__(self, pos, keys=(), values=(), children=(), prev=0, next=0):
+        """Create a new Node representation.
+
+        Keyword arguments:
+            pos -- node's position in file
+            keys -- node's keys, in order (default empty)
+            values -- keys' values, only in leaves (default empty)
+            children -- children's positions, only in inner nodes (default empty)
+            prev -- previous leaf's position (default 0)
+            next -- next leaf's position (default 0)
+        """
+        super().__init__(pos, keys, values, children)
+
+        self.prev = prev
+        self.next = next
+
+
+class PlusLayout():
+    """Represent a B+ tree node's on-disk record.
+
+    A leaf record is the node's position, # of keys, 0 children, previous
+    and next leaves' positions and max_keys (key, value) pairs. An inner
+    record is the node's position, # of keys, # of children, max_inner keys
+    and max_inner + 1 children's positions. Both take node_len cells, so
+    inner nodes, with no values, hold more keys. Empty slots are zero.
+
+    Properties:
+        key_format -- keys' struct format
+        value_format -- values' struct format
+        node -- the PlusNode class for keys and values of these formats
+        round_key -- function that rounds a key as it is saved (None, if keys are not rounded)
+        node_len -- number of cells in a record
+        max_inner -- maximum number of keys in an inner node
+    """
+
+    def __init__(self, key_format, value_format, max_keys, cell=4):
+        """Create a record layout.
+
+        Keyword arguments:
+            key_format -- keys' struct format (e.g. 'i', 'q' or '16s')
+            value_format -- values' struct format
+            max_keys -- number of (key, value) slots in a leaf
+            cell -- file cell's size in bytes (default 4)
+        """
+        self.key_format = Layout.parse(key_format)
+        self.value_format = Layout.parse(value_format)
+        self.node = PlusNode.typed(self.key_format, self.value_format)
+        self.round_key = rounder(self.key_format)
+
+        self.__max_keys = max_keys
+        self.__item = Struct('=' + self.key_format + self.value_format)
+        self.__value_size = Struct('=' + self.value_format).size
+        self.__head = Struct('=3i')     # position, # of keys, # of children
+        self.__leaf = Struct('=5i' + (self.key_format + self.value_format) * max_keys)
+
+        # Inner nodes take as many keys as fit in a leaf's record, at least two
+        key_size = Struct('=' + self.key_format).size
+        size = max(self.__leaf.size, self.__head.size + 2 * key_size + 3 * 4)
+
+        self.max_inner = (size - self.__head.size - 4) // (key_size + 4)
+        self.__inner = Struct('=3i' + self.key_format * self.max_inner + '{}i'.format(self.max_inner + 1))
+
+        # Round up to whole cells
+        self.node_len = -(-size // cell)
+        self.__size = self.node_len * cell
+
+        # Empty slots and trailing NUL bytes
+        self.__key_pad = b'' if self.node.key_type is None else 0
+        self.__value_pad = b'' if self.node.value_type is None else 0
+
+    def pack(self, node):
+        """Return node's record.
+
+        Keyword arguments:
+            node -- a PlusNode
+        """
+        n_keys = len(node.keys)
+        n_children = len(node.children)
+
+        if n_children == 0:
+            values = [self.__key_pad, self.__value_pad] * self.__max_keys
+            values[0:0] = node.pos, n_keys, 0, node.prev, node.next
+            values[5:5 + n_keys * 2:2] = node.keys
+            values[6:6 + n_keys * 2:2] = node.values
+
+            data = self.__leaf.pack(*values)
+        else:
+            keys = list(node.keys) + [self.__key_pad] * (self.max_inner - n_keys)
+            children = list(node.children) + [0] * (self.max_inner + 1 - n_children)
+
+            data = self.__inner.pack(node.pos, n_keys, n_children, *(keys + children))
+
+        return data + bytes(self.__size - len(data))
+
+    def unpack(self, data):
+        """Return the PlusNode in a record.
+
+        Keyword arguments:
+            data -- node's record
+        """
+        pos, n_keys, n_children = self.__head.unpack_from(data)
+
+        if n_children == 0:
+            values = self.__leaf.unpack_from(data)
+
+            # Keys and values are interleaved
+            keys = values[5:5 + n_keys * 2:2]
+            vals = values[6:6 + n_keys * 2:2]
+
+            # Bytes are padded with NUL
+            if self.node.key_type is None:
+                keys = [k.rstrip(b'\0') for k in keys]
+
+            if self.node.value_type is None:
+                vals = [v.rstrip(b'\0') for v in vals]
+
+            return self.node(pos, keys, vals, (), values[3], values[4])
+
+        values = self.__inner.unpack_from(data)
+        keys = values[3:3 + n_keys]
+        children = values[3 + self.max_inner:3 + self.max_inner + n_children]
+
+        if self.node.key_type is None:
+            keys = [k.rstrip(b'\0') for k in keys]
+
+        # Return a PlusNode object
+        return self.node(pos, keys, (), children)
+
+    def check(self, key, value):
+        """Raise ValueError, if key or value cannot be saved in a leaf.
+
+        Keyword arguments:
+            key -- a key
+            value -- key's value
+        """
+        try:
+            self.__item.pack(key, value)
+        except error as e:
+            raise ValueError('Key {} or value {} does not fit in {}: {}.'.format(repr(key), repr(value),
+                                                                                repr(self.__item.format), e))
+
+        # Bytes are cut silently
+        if self.node.key_type is None and len(key) > self.__item.size - self.__value_size:
+            raise ValueError('Key {} is longer than {}.'.format(repr(key), repr(self.key_format)))
+
+        if self.node.value_type is None and len(value) > self.__value_size:
+            raise ValueError('Value {} is longer than {}.'.format(repr(value), repr(self.value_format)))
+
+        # Padding is stripped when read, so trailing NUL bytes would be lost
+        if self.node.key_type is None and key.endswith(b'\0'):
+            raise ValueError('Key {} ends with a NUL byte.'.format(repr(key)))
+
+        if self.node.value_type is None and value.endswith(b'\0'):
+            raise ValueError('Value {} ends with a NUL byte.'.format(repr(value)))
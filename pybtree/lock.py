@@ -0,0 +1,319 @@
+import os
+from functools import wraps
+from inspect import isgeneratorfunction
+from contextlib import contextmanager, nullcontext
+from threading import Condition, Lock, local, get_ident
+
+try:
+    import fcntl
+except ImportError:     # not a POSIX system
+    fcntl = None
+
+
+class RWLock():
+    """Represent a readers-writer lock.
+
+    Many threads may read at once, while a single thread writes. Waiting
+    writers go first, so a stream of readers cannot starve them. Both sides
+    are reentrant and the writing thread may also read. A thread that is
+    reading cannot start writing.
+
+    Properties:
+        readers -- number of reads being held
+        writing -- True, if a thread is writing
+    """
+
+    def __init__(self):
+        """Create an unlocked lock."""
+        self.__cond = Condition(Lock())
+        self.__readers = 0          # reads being held by readers
+        self.__writer = None        # writing thread's id
+        self.__depth = 0            # writer's nested acquisitions
+        self.__waiting = 0          # writers waiting
+        self.__local = local()      # each thread's reads
+
+    @property
+    def readers(self):
+        return self.__readers
+
+    @property
+    def writing(self):
+        return self.__writer is not None
+
+    def acquire_read(self):
+        """Wait until no thread is writing or waiting to write, then read."""
+        me = get_ident()
+        reads = self.__reads()
+
+        with self.__cond:
+            # Writer reads its own changes
+            if self.__writer == me:
+                reads.append(False)
+                return
+
+            # A thread already reading does not wait, or it could wait for itself
+            if not reads:
+                while self.__writer is not None or self.__waiting > 0:
+                    self.__cond.wait()
+
+            self.__readers += 1
+            reads.append(True)
+
+    def release_read(self):
+        """Stop reading."""
+        reads = self.__reads()
+
+        with self.__cond:
+            if reads.pop():
+                self.__readers -= 1
+
+                # Writers may go on
+                if self.__readers == 0:
+                    self.__cond.notify_all()
+
+    def acquire_write(self):
+        """Wait until no other thread is reading or writing, then write."""
+        me = get_ident()
+
+        with self.__cond:
+            if self.__writer == me:
+                self.__depth += 1
+                return
+
+            if any(self.__reads()):
+                raise RuntimeError('A thread reading the tree cannot change it.')
+
+            self.__waiting += 1
+
+            try:
+                while self.__writer is not None or self.__readers > 0:
+                    self.__cond.wait()
+            finally:
+                self.__waiting -= 1
+
+            self.__writer = me
+            self.__depth = 1
+
+    def release_write(self):
+        """Stop writing."""
+        with self.__cond:
+            self.__depth -= 1
+
+            # Readers and writers may go on
+            if self.__depth == 0:
+                self.__writer = None
+                self.__cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        """Hold the lock for reading in a with statement."""
+        self.acquire_read()
+
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        """Hold the lock for writing in a with statement."""
+        self.acquire_write()
+
+        try:
+            yield
+        finally:
+            self.release_write()
+
+    def __reads(self):
+        """Return the current thread's reads, True for each one counted in readers."""
+        reads = getattr(self.__local, 'reads', None)
+
+        if reads is None:
+            reads = self.__local.reads = []
+
+        return reads
+
+    def __repr__(self):
+        """Class representation string."""
+        return "{}(readers={}, writing={})".format(self.__class__.__name__,
+                                                   self.__readers,
+                                                   self.writing)
+
+
+class NoLock():
+    """Represent a lock that never blocks, for trees used by a single thread."""
+    __none = nullcontext()
+
+    def read(self):
+        """Do nothing in a with statement."""
+        return self.__none
+
+    def write(self):
+        """Do nothing in a with statement."""
+        return self.__none
+
+    def __repr__(self):
+        """Class representation string."""
+        return "{}()".format(self.__class__.__name__)
+
+
+class FileLock():
+    """Represent an advisory lock on a file shared by processes, taken
+    after a lock shared by threads.
+
+    Readers hold the file shared and writers hold it exclusive. The file
+    is locked while any thread of the process holds the lock.
+
+    Properties:
+        path -- lock file's path
+    """
+
+    def __init__(self, path, inner, acquired, releasing):
+        """Create an unlocked lock.
+
+        Keyword arguments:
+            path -- lock file's path, created if it does not exist
+            inner -- lock shared by the process' threads (an RWLock or NoLock)
+            acquired -- function called with the file just locked, to see other processes' changes
+            releasing -- function called before an exclusive lock is released, to show changes
+        """
+        if fcntl is None:
+            raise ValueError('Locking a file for many processes needs fcntl (a POSIX system).')
+
+        self.path = path
+        self.__fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.__inner = inner
+        self.__acquired = acquired
+        self.__releasing = releasing
+
+        self.__mutex = Lock()       # guards the holders' count
+        self.__holders = 0          # threads' holds of the file lock
+        self.__mode = None          # fcntl.LOCK_SH or fcntl.LOCK_EX
+
+    @contextmanager
+    def read(self):
+        """Hold the lock shared in a with statement."""
+        with self.__inner.read():
+            self.__acquire(fcntl.LOCK_SH)
+
+            try:
+                yield
+            finally:
+                self.__release()
+
+    @contextmanager
+    def write(self):
+        """Hold the lock exclusive in a with statement."""
+        with self.__inner.write():
+            self.__acquire(fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                self.__release()
+
+    def close(self):
+        """Close the lock file. Closing again does nothing."""
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+    def __acquire(self, mode):
+        """Lock the file, if no thread holds it yet.
+
+        Keyword arguments:
+            mode -- fcntl.LOCK_SH or fcntl.LOCK_EX
+        """
+        with self.__mutex:
+            # Lock file is closed with the tree
+            if self.__fd is None:
+                raise ValueError('BTree is closed.')
+
+            if self.__holders == 0:
+                fcntl.flock(self.__fd, mode)
+                self.__mode = mode
+                self.__holders = 1
+
+                # Nothing is read before other processes' changes are seen
+                try:
+                    self.__acquired()
+                except BaseException:
+                    self.__holders = 0
+                    fcntl.flock(self.__fd, fcntl.LOCK_UN)
+                    raise
+
+                return
+
+            # A shared lock cannot become exclusive while it is held
+            if mode == fcntl.LOCK_EX and self.__mode == fcntl.LOCK_SH:
+                raise RuntimeError('A process reading the tree cannot change it.')
+
+            self.__holders += 1
+
+    def __release(self):
+        """Unlock the file, if no other thread holds it."""
+        with self.__mutex:
+            if self.__holders == 1 and self.__mode == fcntl.LOCK_EX:
+                try:
+                    self.__releasing()
+                finally:
+                    self.__unlock()
+            elif self.__holders == 1:
+                self.__unlock()
+            else:
+                self.__holders -= 1
+
+    def __unlock(self):
+        """Release the file lock."""
+        self.__holders = 0
+        self.__mode = None
+
+        # Closing the file released it already
+        if self.__fd is not None:
+            fcntl.flock(self.__fd, fcntl.LOCK_UN)
+
+    def __repr__(self):
+        """Class representation string."""
+        return "{}({})".format(self.__class__.__name__, self.path)
+
+    def __del__(self):
+        """Close lock file right before object is deleted."""
+        self.close()
+
+
+def reading(method):
+    """Run a tree's method holding its lock for reading. A generator holds
+    it until it is exhausted or closed."""
+    if isgeneratorfunction(method):
+        @wraps(method)
+        def generator(self, *args, **kwargs):
+            with self.lock.read():
+                yield from method(self, *args, **kwargs)
+
+        return generator
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def writing(method):
+    """Run a tree's method holding its lock for writing. A generator holds
+    it until it is exhausted or closed."""
+    if isgeneratorfunction(method):
+        @wraps(method)
+        def generator(self, *args, **kwargs):
+            with self.lock.write():
+                yield from method(self, *args, **kwargs)
+
+        return generator
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.write():
+            return method(self, *args, **kwargs)
+
+    return wrapper
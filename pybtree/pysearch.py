@@ -20,7 +20,7 @@ def search(sequence, n, key=def_key, how='binary'):
         (default is the element itself)
         how -- {'linear', (default 'binary')}
     """
-    return eval('{}(sequence, n, key)'.format(how))
+    return SEARCHES[how](sequence, n, key)
 
 
 def linear(sequence, n, key=def_key):
@@ -90,3 +90,10 @@ def binary(sequence, n, key=def_key):
 
     # Did not find the element
     return None
+
+
+# Search algorithms by name
+SEARCHES = {
+    'linear': linear,
+    'binary': binary
+}
@@ -0,0 +1,245 @@
+from time import perf_counter
+from functools import wraps
+from inspect import isgeneratorfunction
+from contextlib import contextmanager
+from collections import Counter
+from threading import Lock, local
+
+
+# Events counted in each operation
+EVENTS = ('loads', 'saves', 'bytes_read', 'bytes_written', 'splits', 'rotations', 'joins', 'relocations',
+          'filtered')
+
+
+class Histogram():
+    """Represent a histogram of latencies in power-of-two buckets of
+    microseconds. The ith bucket holds latencies below 2 ** i us.
+
+    Properties:
+        count -- number of latencies
+        total -- sum of latencies in seconds
+        max -- greatest latency in seconds
+        mean -- mean latency in seconds
+    """
+    n_buckets = 40
+
+    def __init__(self):
+        """Create an empty histogram."""
+        self.buckets = [0] * self.n_buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def add(self, seconds):
+        """Add a latency.
+
+        Keyword arguments:
+            seconds -- latency in seconds
+        """
+        i = min(self.n_buckets - 1, int(seconds * 1e6).bit_length())
+
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        """Return the upper bound in seconds of the bucket with the pth
+        percentile. 0.0, if there is no latency.
+
+        Keyword arguments:
+            p -- percentile, in [0, 100]
+        """
+        rank = p / 100 * self.count
+        seen = 0
+
+        for i, n in enumerate(self.buckets):
+            seen += n
+
+            if n > 0 and seen >= rank:
+                return min(self.max, (1 << i) / 1e6)
+
+        return 0.0
+
+    def snapshot(self):
+        """Return mean, p50, p90, p99 and max latencies in seconds."""
+        return {
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+
+    def __repr__(self):
+        """Class representation string."""
+        return "{}(count={}, mean={:.6f})".format(self.__class__.__name__, self.count, self.mean)
+
+
+class OperationStats():
+    """Represent the counters of one type of operation.
+
+    Properties:
+        count -- number of operations
+        events -- a Counter of events (see EVENTS), summed over operations
+        latency -- a Histogram of operations' latencies
+    """
+
+    def __init__(self):
+        """Create empty counters."""
+        self.count = 0
+        self.events = Counter()
+        self.latency = Histogram()
+
+    def snapshot(self):
+        """Return counters and latencies as a dict."""
+        snapshot = {'count': self.count, 'latency': self.latency.snapshot()}
+        snapshot.update((event, self.events[event]) for event in EVENTS)
+
+        return snapshot
+
+    def __repr__(self):
+        """Class representation string."""
+        return "{}(count={})".format(self.__class__.__name__, self.count)
+
+
+class Stats():
+    """Represent a tree's counters of events, per type of operation and in
+    total, and its operations' latencies.
+
+    Events are counted by the thread running an operation and added to the
+    shared counters when it ends. Events out of any operation (e.g. opening
+    the tree) only count in totals. An operation called by another one is
+    part of it.
+
+    Properties:
+        totals -- a Counter of every event counted
+        operations -- OperationStats by operation's name
+        height -- tree's height (1, if the root is a leaf)
+        trace -- function called after each operation (None, if not set)
+    """
+
+    def __init__(self, height, trace=None):
+        """Create empty counters.
+
+        Keyword arguments:
+            height -- function that returns tree's height
+            trace -- function called after each operation with its name, latency in
+                     seconds and a Counter of its events (default None)
+        """
+        self.trace = trace
+        self.totals = Counter()
+        self.operations = {}
+
+        self.__height = height
+        self.__lock = Lock()        # guards shared counters
+        self.__local = local()      # each thread's current operation
+
+    @property
+    def height(self):
+        return self.__height()
+
+    def count(self, event, n=1):
+        """Count an event.
+
+        Keyword arguments:
+            event -- event's name (see EVENTS)
+            n -- number of times it happened (default 1)
+        """
+        events = getattr(self.__local, 'events', None)
+
+        if events is not None:
+            events[event] += n
+            return
+
+        with self.__lock:
+            self.totals[event] += n
+
+    @contextmanager
+    def operation(self, name):
+        """Count the events of an operation and time it in a with statement.
+
+        Keyword arguments:
+            name -- operation's name
+        """
+        # Part of an operation already being counted
+        if getattr(self.__local, 'events', None) is not None:
+            yield
+            return
+
+        events = self.__local.events = Counter()
+        start = perf_counter()
+
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            self.__local.events = None
+
+            with self.__lock:
+                stats = self.operations.get(name)
+
+                if stats is None:
+                    stats = self.operations[name] = OperationStats()
+
+                stats.count += 1
+                stats.events.update(events)
+                stats.latency.add(seconds)
+                self.totals.update(events)
+
+            if self.trace is not None:
+                self.trace(name, seconds, events)
+
+    def reset(self):
+        """Zero every counter."""
+        with self.__lock:
+            self.totals = Counter()
+            self.operations = {}
+
+    def snapshot(self):
+        """Return height, totals and each operation's counters as a dict."""
+        # Nodes read to get the height are counted too
+        height = self.height
+
+        with self.__lock:
+            return {
+                'height': height,
+                'totals': {event: self.totals[event] for event in EVENTS},
+                'operations': {name: stats.snapshot() for name, stats in self.operations.items()}
+            }
+
+    def __repr__(self):
+        """Class representation string."""
+        return "{}({})".format(self.__class__.__name__, dict(self.totals))
+
+
+def measured(method):
+    """Count a tree's method as an operation in its stats, if enabled. A
+    generator is counted until it is exhausted or closed."""
+    name = method.__name__
+
+    if isgeneratorfunction(method):
+        @wraps(method)
+        def generator(self, *args, **kwargs):
+            if self.stats is None:
+                yield from method(self, *args, **kwargs)
+                return
+
+            with self.stats.operation(name):
+                yield from method(self, *args, **kwargs)
+
+        return generator
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.stats is None:
+            return method(self, *args, **kwargs)
+
+        with self.stats.operation(name):
+            return method(self, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,424 @@
+import os
+import mmap
+from struct import Struct
+from threading import Lock
+
+
+class NodeFile():
+    """Represent a binary file of fixed-size cells read and written in blocks.
+
+    Every read and write is a single positioned system call, no matter how
+    many cells it covers, so a whole node goes to/from disk at once. Cells
+    are read and written as raw bytes, block(n) packs/unpacks n of them.
+
+    Properties:
+        cell -- cell's size in bytes
+        size -- file's size in bytes
+        length -- number of cells in file
+        n_reads -- number of reads made
+        n_writes -- number of writes made
+        bytes_read -- number of bytes read
+        bytes_written -- number of bytes written
+    """
+
+    def __init__(self, filepath, fmt='i'):
+        """Open file in binary mode.
+
+        Keyword arguments:
+            filepath -- absolute/relative path of the file
+            fmt -- format of a single cell (default 'i')
+        """
+        self.__filepath = filepath
+        self.__fmt = fmt
+        self.__structs = {}              # block structs by number of cells
+        self.cell = Struct(fmt).size
+
+        # I/O counters
+        self.n_reads = 0
+        self.n_writes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+        # Open file unbuffered, all I/O is positioned
+        try:
+            self.__file = open(filepath, 'rb+', buffering=0)
+        except FileNotFoundError:
+            self.__file = open(filepath, 'wb+', buffering=0)
+
+        self.__fd = self.__file.fileno()
+        self.__seek = Lock()             # shared offset, where there is no pread/pwrite
+
+    @property
+    def size(self):
+        """Return the file size in bytes."""
+        return os.fstat(self.__fd).st_size
+
+    @property
+    def length(self):
+        """Return the number of cells in file."""
+        return self.size // self.cell
+
+    def block(self, n):
+        """Return a Struct for a block of n cells.
+
+        Keyword arguments:
+            n -- number of cells in block
+        """
+        strct = self.__structs.get(n)
+
+        if strct is None:
+            strct = Struct('{}{}'.format(n, self.__fmt))
+            self.__structs[n] = strct
+
+        return strct
+
+    def read(self, i, n):
+        """Read n cells starting from the ith with a single read.
+
+        Return the cells' bytes. None, if the block is out of file.
+
+        Keyword arguments:
+            i -- first cell's index
+            n -- number of cells to be read
+        """
+        size = n * self.cell
+        data = self.__pread(size, i * self.cell)
+
+        self.n_reads += 1
+        self.bytes_read += len(data)
+
+        if len(data) < size:
+            return None
+
+        return data
+
+    def write(self, i, data):
+        """Write bytes starting from the ith cell with a single write.
+
+        Keyword arguments:
+            i -- first cell's index
+            data -- bytes of whole cells
+        """
+        self.__pwrite(data, i * self.cell)
+
+        self.n_writes += 1
+        self.bytes_written += len(data)
+
+    def append(self, data):
+        """Write bytes at the end of file.
+
+        Keyword arguments:
+            data -- bytes of whole cells
+        """
+        self.write(self.length, data)
+
+    def truncate(self, n):
+        """Erase the last n cells from file.
+
+        Keyword arguments:
+            n -- number of cells to be removed
+        """
+        self.__file.truncate(self.size - n * self.cell)
+
+    def flush(self):
+        """Nothing to flush, writes are unbuffered."""
+        pass
+
+    def sync(self):
+        """Force written cells to disk."""
+        os.fsync(self.__fd)
+
+    def refresh(self):
+        """Nothing to refresh, the size is always read from file."""
+        pass
+
+    def replaced(self):
+        """Return True, if file's path names another file now (e.g. the file
+        was compacted by another process)."""
+        return _replaced(self.__filepath, self.__fd)
+
+    def close(self):
+        """Close file."""
+        self.__file.close()
+
+    def __pread(self, n, offset):
+        """Read n bytes at offset."""
+        if hasattr(os, 'pread'):
+            return os.pread(self.__fd, n, offset)
+
+        with self.__seek:
+            self.__file.seek(offset)
+            return self.__file.read(n)
+
+    def __pwrite(self, data, offset):
+        """Write data at offset."""
+        if hasattr(os, 'pwrite'):
+            os.pwrite(self.__fd, data, offset)
+        else:
+            with self.__seek:
+                self.__file.seek(offset)
+                self.__file.write(data)
+
+    def __repr__(self):
+        """Class representation string."""
+        return "{}({}, {})".format(self.__class__.__name__,
+                                   self.__filepath,
+                                   self.__fmt)
+
+    def __del__(self):
+        """Close file right before object is deleted."""
+        self.__file.close()
+
+
+class MmapNodeFile():
+    """Represent a binary file of fixed-size cells mapped in memory.
+
+    Cells are copied straight out of the mapping, so reading a warm node
+    costs no system call. The file grows in chunks, the spare bytes after
+    the last cell are zeroed and are cut off when the file is closed. With
+    no chunk, the file always has its real size, so other processes can
+    share it.
+
+    Properties:
+        cell -- cell's size in bytes
+        size -- data's size in bytes
+        length -- number of cells in file
+        n_reads -- number of reads made (copies out of the mapping)
+        n_writes -- number of writes made (copies into the mapping)
+        bytes_read -- number of bytes read
+        bytes_written -- number of bytes written
+    """
+
+    def __init__(self, filepath, fmt='i', chunk=1 << 20):
+        """Open and map file.
+
+        Keyword arguments:
+            filepath -- absolute/relative path of the file
+            fmt -- format of a single cell (default 'i')
+            chunk -- minimum number of bytes to grow the file by, 0 for exact growth (default 1MiB)
+        """
+        self.__filepath = filepath
+        self.__fmt = fmt
+        self.__chunk = chunk
+        self.__structs = {}              # block structs by number of cells
+        self.cell = Struct(fmt).size
+
+        # I/O counters
+        self.n_reads = 0
+        self.n_writes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+        # Open file
+        try:
+            self.__file = open(filepath, 'rb+', buffering=0)
+        except FileNotFoundError:
+            self.__file = open(filepath, 'wb+', buffering=0)
+
+        self.__fd = self.__file.fileno()
+        self.__size = os.fstat(self.__fd).st_size   # data's size
+        self.__mapped = 0                            # mapping's size
+        self.__map = None
+        self.__view = None
+
+        self.__remap(self.__size)
+
+    @property
+    def size(self):
+        """Return data's size in bytes."""
+        return self.__size
+
+    @property
+    def length(self):
+        """Return the number of cells in file."""
+        return self.__size // self.cell
+
+    def block(self, n):
+        """Return a Struct for a block of n cells.
+
+        Keyword arguments:
+            n -- number of cells in block
+        """
+        strct = self.__structs.get(n)
+
+        if strct is None:
+            strct = Struct('{}{}'.format(n, self.__fmt))
+            self.__structs[n] = strct
+
+        return strct
+
+    def read(self, i, n):
+        """Copy n cells starting from the ith out of the mapping.
+
+        Return the cells' bytes. None, if the block is out of file.
+
+        Keyword arguments:
+            i -- first cell's index
+            n -- number of cells to be read
+        """
+        offset = i * self.cell
+        end = offset + n * self.cell
+
+        if end > self.__size:
+            return None
+
+        self.n_reads += 1
+        self.bytes_read += end - offset
+
+        return self.__map[offset:end]
+
+    def write(self, i, data):
+        """Copy bytes starting from the ith cell into the mapping.
+
+        Keyword arguments:
+            i -- first cell's index
+            data -- bytes of whole cells
+        """
+        offset = i * self.cell
+        end = offset + len(data)
+
+        # Grow mapping, if needed
+        if end > self.__mapped:
+            self.__grow(end)
+
+        self.__view[offset:end] = data
+        self.__size = max(self.__size, end)
+
+        self.n_writes += 1
+        self.bytes_written += len(data)
+
+    def append(self, data):
+        """Write bytes at the end of file.
+
+        Keyword arguments:
+            data -- bytes of whole cells
+        """
+        self.write(self.length, data)
+
+    def truncate(self, n):
+        """Erase the last n cells from file.
+
+        Keyword arguments:
+            n -- number of cells to be removed
+        """
+        size = self.__size - n * self.cell
+
+        if size == self.__size:
+            return
+
+        # File has its real size
+        if self.__chunk == 0:
+            self.__unmap()
+            self.__file.truncate(size)
+            self.__remap(size)
+            self.__size = size
+            return
+
+        # Zero spare bytes, so they never look like data
+        self.__view[size:self.__size] = bytes(self.__size - size)
+        self.__size = size
+
+    def flush(self):
+        """Flush mapping's changes to disk."""
+        if self.__map is not None:
+            self.__map.flush()
+
+    def sync(self):
+        """Force written cells and file's size to disk."""
+        self.flush()
+        os.fsync(self.__fd)
+
+    def refresh(self):
+        """Map the cells written by other processes, if file's size changed.
+        Only files with no chunk are shared."""
+        size = os.fstat(self.__fd).st_size
+
+        if size != self.__size:
+            self.__unmap()
+            self.__remap(size)
+            self.__size = size
+
+    def replaced(self):
+        """Return True, if file's path names another file now (e.g. the file
+        was compacted by another process)."""
+        return _replaced(self.__filepath, self.__fd)
+
+    def close(self):
+        """Unmap and close file, cutting off the spare bytes."""
+        if self.__file.closed:
+            return
+
+        self.flush()
+        self.__unmap()
+        self.__file.truncate(self.__size)
+        self.__file.close()
+
+    def __grow(self, size):
+        """Grow file and mapping to hold at least size bytes.
+
+        Keyword arguments:
+            size -- minimum number of bytes
+        """
+        # Grow by a chunk or double the mapping, whatever is bigger
+        if self.__chunk > 0:
+            size = max(size, self.__mapped + self.__chunk, self.__mapped * 2)
+
+        self.__unmap()
+        self.__file.truncate(size)
+        self.__remap(size)
+
+    def __remap(self, size):
+        """Map the first size bytes of file.
+
+        Keyword arguments:
+            size -- number of bytes to be mapped
+        """
+        if size == 0:
+            return
+
+        self.__map = mmap.mmap(self.__fd, size)
+        self.__view = memoryview(self.__map)
+        self.__mapped = size
+
+    def __unmap(self):
+        """Release the current mapping."""
+        if self.__map is not None:
+            self.__view.release()
+            self.__map.close()
+
+        self.__mapped = 0
+        self.__map = None
+        self.__view = None
+
+    def __repr__(self):
+        """Class representation string."""
+        return "{}({}, {})".format(self.__class__.__name__,
+                                   self.__filepath,
+                                   self.__fmt)
+
+    def __del__(self):
+        """Close file right before object is deleted."""
+        self.close()
+
+
+def _replaced(filepath, fd):
+    """Return True, if filepath does not name the file open in fd anymore.
+
+    Keyword arguments:
+        filepath -- file's path
+        fd -- file's descriptor
+    """
+    try:
+        path = os.stat(filepath)
+    except FileNotFoundError:
+        return True
+
+    current = os.fstat(fd)
+    return (path.st_dev, path.st_ino) != (current.st_dev, current.st_ino)
+
+
+# Storage backends by name
+STORAGES = {
+    'file': NodeFile,
+    'mmap': MmapNodeFile
+}
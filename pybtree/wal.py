@@ -0,0 +1,292 @@
+import os
+import zlib
+from struct import Struct
+
+
+class WriteAheadLog():
+    """Represent a sidecar log of cell writes, grouped in records.
+
+    A record holds every write of one operation and is only replayed if it
+    is complete, so an operation is either fully applied or not at all.
+
+    Record layout: payload's size, payload's crc32 and payload, which is a
+    sequence of (first cell's index, number of bytes, bytes).
+
+    Properties:
+        size -- log's size in bytes
+    """
+    record = Struct('<II')   # payload's size, crc32
+    entry = Struct('<qI')    # first cell's index, number of bytes
+
+    def __init__(self, filepath):
+        """Open log for appending.
+
+        Keyword arguments:
+            filepath -- absolute/relative path of the log
+        """
+        self.__filepath = filepath
+        self.__fd = os.open(filepath, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+
+    @property
+    def size(self):
+        """Return the log's size in bytes."""
+        return os.fstat(self.__fd).st_size
+
+    def append(self, writes):
+        """Append a record with one operation's writes. It is not durable
+        until sync is called.
+
+        Keyword arguments:
+            writes -- a sequence of (first cell's index, bytes)
+        """
+        payload = b''.join(self.entry.pack(i, len(data)) + data for i, data in writes)
+
+        header = self.record.pack(len(payload), zlib.crc32(payload))
+        os.write(self.__fd, header + payload)
+
+    def sync(self):
+        """Force appended records to disk."""
+        os.fsync(self.__fd)
+
+    def replay(self, write):
+        """Apply all complete records, in order, stopping at the first
+        torn or corrupted one.
+
+        Return the number of records applied.
+
+        Keyword arguments:
+            write -- function that writes bytes from the ith cell on
+        """
+        with open(self.__filepath, 'rb') as f:
+            data = f.read()
+
+        offset = 0
+        n = 0
+
+        while offset + self.record.size <= len(data):
+            size, crc = self.record.unpack_from(data, offset)
+            start = offset + self.record.size
+            payload = data[start:start + size]
+
+            # Torn or corrupted record, nothing after it was committed
+            if len(payload) < size or zlib.crc32(payload) != crc:
+                break
+
+            # Apply each write in record
+            pos = 0
+
+            while pos < size:
+                i, count = self.entry.unpack_from(payload, pos)
+                pos += self.entry.size
+
+                write(i, payload[pos:pos + count])
+                pos += count
+
+            offset = start + size
+            n += 1
+
+        return n
+
+    def reset(self):
+        """Erase all records, once they are safe in the main file."""
+        os.ftruncate(self.__fd, 0)
+        os.fsync(self.__fd)
+
+    def close(self):
+        """Close log."""
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+    def __repr__(self):
+        """Class representation string."""
+        return "{}({})".format(self.__class__.__name__, self.__filepath)
+
+    def __del__(self):
+        """Close log right before object is deleted."""
+        self.close()
+
+
+class LoggedNodeFile():
+    """Represent a node file whose writes are held in memory until they
+    are committed, optionally through a write-ahead log.
+
+    Uncommitted writes can be rolled back. With a log, committed writes are
+    logged and only reach the main file after a group of operations is
+    synced. Without it, they are written in file order at commit. Reads see
+    the held writes, so the file looks already changed. A read should start
+    where a write started (a node, the header or a free slot).
+
+    Properties:
+        cell -- cell's size in bytes
+        size -- file's size in bytes, held writes included
+        length -- number of cells in file, held writes included
+        storage -- the main file
+        wal -- the log (None, if writes are only held)
+        closed -- True, once both files are closed
+    """
+
+    def __init__(self, storage, wal=None, group_commit=1, checkpoint=1 << 24):
+        """Wrap a storage.
+
+        Keyword arguments:
+            storage -- the main file (a NodeFile or MmapNodeFile)
+            wal -- a WriteAheadLog (default None)
+            group_commit -- number of operations per log sync (default 1)
+            checkpoint -- log's size in bytes that triggers a checkpoint (default 16MiB)
+        """
+        self.storage = storage
+        self.wal = wal
+        self.group_commit = group_commit
+        self.checkpoint_size = checkpoint
+
+        self.__record = {}        # uncommitted writes, by first cell
+        self.__held = {}          # logged writes not in main file yet, by first cell
+        self.__n_commits = 0      # operations logged since the last sync
+        self.__length = storage.length
+        self.cell = storage.cell
+        self.closed = False
+
+    @property
+    def size(self):
+        """Return the file size in bytes, held writes included."""
+        return self.__length * self.cell
+
+    @property
+    def length(self):
+        """Return the number of cells in file, held writes included."""
+        return self.__length
+
+    def block(self, n):
+        """Return a Struct for a block of n cells.
+
+        Keyword arguments:
+            n -- number of cells in block
+        """
+        return self.storage.block(n)
+
+    def read(self, i, n):
+        """Read n cells starting from the ith, held writes first.
+
+        Keyword arguments:
+            i -- first cell's index
+            n -- number of cells to be read
+        """
+        data = self.__record.get(i)
+
+        if data is None:
+            data = self.__held.get(i)
+
+        if data is not None and len(data) >= n * self.cell:
+            return data[:n * self.cell]
+
+        return self.storage.read(i, n)
+
+    def write(self, i, data):
+        """Hold bytes to be written from the ith cell on.
+
+        Keyword arguments:
+            i -- first cell's index
+            data -- bytes of whole cells
+        """
+        # A shorter write only changes the first cells of a held one
+        held = self.__record.get(i)
+
+        if held is None:
+            held = self.__held.get(i)
+
+        if held is not None and len(held) > len(data):
+            data = data + held[len(data):]
+
+        self.__record[i] = data
+        self.__length = max(self.__length, i + len(data) // self.cell)
+
+    def append(self, data):
+        """Hold bytes to be written at the end of file.
+
+        Keyword arguments:
+            data -- bytes of whole cells
+        """
+        self.write(self.__length, data)
+
+    def truncate(self, n):
+        """Erase the last n cells from file.
+
+        Keyword arguments:
+            n -- number of cells to be removed
+        """
+        self.commit()
+        self.sync()
+        self.storage.truncate(n)
+        self.__length = self.storage.length
+
+    def commit(self):
+        """End an operation. Log its writes and sync, if a group is complete.
+        Without a log, write them in file order."""
+        if self.__record:
+            if self.wal is not None:
+                self.wal.append(sorted(self.__record.items()))
+                self.__n_commits += 1
+
+            self.__held.update(self.__record)
+            self.__record = {}
+
+        if self.wal is None or self.__n_commits >= self.group_commit:
+            self.sync()
+
+    def rollback(self):
+        """Throw uncommitted writes away."""
+        self.__record = {}
+
+        # File ends where the last committed write ends
+        ends = (i + len(data) // self.cell for i, data in self.__held.items())
+        self.__length = max(self.storage.length, max(ends, default=0))
+
+    def sync(self):
+        """Make all committed operations durable and write them in the main
+        file. Checkpoint, if the log is too big."""
+        if self.__n_commits > 0:
+            self.wal.sync()
+            self.__n_commits = 0
+
+        # Only committed writes go to the main file
+        for i in sorted(self.__held):
+            self.storage.write(i, self.__held[i])
+
+        self.__held.clear()
+
+        if self.wal is not None and self.wal.size >= self.checkpoint_size:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Make the main file durable and erase the log."""
+        self.storage.sync()
+
+        if self.wal is not None:
+            self.wal.reset()
+
+    def flush(self):
+        """Sync committed writes and flush the main file."""
+        self.sync()
+        self.storage.flush()
+
+    def close(self):
+        """Write committed writes in the main file, erase the log and close
+        both. Uncommitted writes are lost. Closing again does nothing."""
+        if self.closed:
+            return
+
+        self.flush()
+        self.checkpoint()
+        self.storage.close()
+
+        if self.wal is not None:
+            self.wal.close()
+
+        self.closed = True
+
+    def __repr__(self):
+        """Class representation string."""
+        return "{}({}, {})".format(self.__class__.__name__,
+                                   repr(self.storage),
+                                   repr(self.wal))
@@ -0,0 +1,148 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from pybtree import BTree, BPlusTree
+
+
+class TreeTestCase(unittest.TestCase):
+    """Give each test a directory of its own for tree files."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+
+class TestFloatKeys(TreeTestCase):
+
+    def check_tree(self, tree):
+        # 0.1 has no exact single precision float
+        tree.insert(0.1, 1)
+        self.assertEqual(tree.search(0.1), 1)
+
+        # An existing key gets the new value
+        tree.insert(0.1, 2)
+        self.assertEqual(tree.search(0.1), 2)
+        self.assertEqual(len(list(tree.items())), 1)
+        self.assertEqual(list(tree.range(0.1, 0.2)), [(0.10000000149011612, 2)])
+
+        tree.delete(0.1)
+        self.assertIsNone(tree.search(0.1))
+
+    def test_btree(self):
+        with BTree(self.path('f.btree'), 2, key_format='f') as tree:
+            self.check_tree(tree)
+
+            tree.insert_many([(0.1, 1), (0.3, 2)])
+            tree.insert_many([(0.1, 3)])
+            self.assertEqual(tree.search_many([0.1, 0.3, 0.7]), [3, 2, None])
+            self.assertTrue(tree.check())
+
+        # Keys read back from file are found too
+        with BTree(self.path('f.btree')) as tree:
+            self.assertEqual(tree.search(0.3), 2)
+
+    def test_slotted_btree(self):
+        with BTree(self.path('f.btree'), key_format='f', value_format='bytes', page_size=512) as tree:
+            tree.insert(0.1, b'a')
+            tree.insert(0.1, b'b')
+            self.assertEqual(list(tree.items()), [(0.10000000149011612, b'b')])
+
+    def test_bplustree(self):
+        with BPlusTree(self.path('f.bptree'), 2, key_format='f') as tree:
+            self.check_tree(tree)
+
+
+
+class TestBytes(TreeTestCase):
+
+    def test_trailing_nul(self):
+        trees = (BTree(self.path('s.btree'), 2, key_format='4s', value_format='4s'),
+                 BTree(self.path('p.btree'), key_format='4s', value_format='4s', page_size=512),
+                 BPlusTree(self.path('s.bptree'), 2, key_format='4s', value_format='4s'))
+
+        for tree in trees:
+            with tree:
+                # NUL padding is stripped when read, so b'a\0' would come back as b'a'
+                with self.assertRaisesRegex(ValueError, 'NUL'):
+                    tree.insert(b'a\0', b'x')
+
+                with self.assertRaisesRegex(ValueError, 'NUL'):
+                    tree.insert(b'a', b'x\0')
+
+                # NUL bytes before the end are kept
+                tree.insert(b'a\0b', b'x\0y')
+                self.assertEqual(tree.search(b'a\0b'), b'x\0y')
+                self.assertIsNone(tree.search(b'a'))
+
+
+class TestCheck(TreeTestCase):
+
+    def test_duplicate_keys(self):
+        path = self.path('dup.btree')
+
+        with BTree(path, 2) as tree:
+            for key in (1, 2, 3):
+                tree.insert(key, key)
+
+            self.assertTrue(tree.check())
+            pos = tree.root.pos
+
+        # Root's record is position, # of keys, # of children and (key, value)
+        # pairs, so the second key is the 6th cell
+        with open(path, 'r+b') as f:
+            f.seek((pos + 5) * 4)
+            f.write(struct.pack('=i', 1))
+
+        with BTree(path) as tree:
+            with self.assertRaisesRegex(ValueError, '#{}: Keys out of order or duplicated'.format(pos)):
+                tree.check()
+
+
+
+class TestClose(TreeTestCase):
+
+    def check_close(self, **kwargs):
+        path = self.path('close.btree')
+
+        with BTree(path, 2, **kwargs) as tree:
+            tree.insert(1, 10)
+            tree.close()
+
+        tree.close()
+
+        with BTree(path, **kwargs) as tree:
+            self.assertEqual(tree.search(1), 10)
+
+    def test_file(self):
+        self.check_close()
+
+    def test_mmap(self):
+        self.check_close(storage='mmap')
+
+    def test_wal(self):
+        self.check_close(wal=True)
+        self.assertFalse(os.path.exists(self.path('close.btree-wal')))
+
+    def test_shared(self):
+        self.check_close(shared=True)
+
+        tree = BTree(self.path('close.btree'), shared=True)
+        tree.close()
+
+        with self.assertRaisesRegex(ValueError, 'BTree is closed'):
+            tree.search(1)
+
+        with self.assertRaisesRegex(ValueError, 'BTree is closed'):
+            tree.insert(2, 20)
+
+
+if __name__ == '__main__':
+    unittest.main()